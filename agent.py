@@ -7,20 +7,24 @@ Fonctionne sur Kali Linux et Windows
 """
 
 import socket
-import json
+import select
+import threading
 import platform
 import os
 import time
 import uuid
 import psutil
-from datetime import datetime, timedelta
+from datetime import datetime
 import subprocess
 import shutil
 import logging
 import glob
 import gzip
 import backoff
+import orjson
 import traceback
+from collections import OrderedDict, deque
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
 
 try:
@@ -47,6 +51,12 @@ RESOURCE_THRESHOLD = 80
 STORAGE_LIMIT = 200 * 1024 * 1024  # 200 Mo
 FILES_PER_BATCH = 5
 BATCH_PAUSE = 3  # Pause de 3s toutes les 5 fichiers
+GZIP_LEVEL = 1  # Niveau de compression des fichiers (1 = rapide, 9 = compact)
+NET_PROBE_INTERVAL = 60  # Délai minimal (s) entre deux tests de connexion Internet
+PAYLOAD_CACHE_LIMIT = 4 * 1024 * 1024  # Fichiers récents gardés en mémoire pour l'envoi (4 Mo)
+UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+SYSTEM = platform.system()  # Système d'exploitation, fixe pendant l'exécution
+CPU_THERMAL_TYPES = ('x86_pkg_temp', 'coretemp', 'cpu')  # Types de zones thermiques /sys correspondant au CPU
 
 # Création du répertoire de données
 if not os.path.exists(DATA_DIR):
@@ -55,9 +65,21 @@ if not os.path.exists(DATA_DIR):
 # Variables globales
 file_counter = 1
 initial_data_saved = False
+data_dir_size = 0  # Taille des fichiers .json.gz en attente, tenue à jour à chaque écriture/suppression
 system_boot_time = datetime.fromtimestamp(psutil.boot_time())
 script_start_time = datetime.now()
+system_boot_time_str = system_boot_time.strftime("%Y-%m-%d %H:%M:%S")
+script_start_time_str = script_start_time.strftime("%Y-%m-%d %H:%M:%S")
 last_shutdown_time = None
+_wmi_connections: Dict[Optional[str], Any] = {}  # Connexions WMI ouvertes une seule fois (Windows)
+_bios_info: Optional[Dict[str, Any]] = None  # Le BIOS ne change pas pendant l'exécution
+net_ok = False  # Dernier état connu de la connexion réseau
+net_checked_at = 0.0  # Moment (time.time) où net_ok a été mis à jour
+server_sock: Optional[socket.socket] = None  # Connexion au serveur conservée entre deux envois
+server_reader = None  # Lecteur tamponné des réponses sur server_sock
+recent_payloads: "OrderedDict[str, bytes]" = OrderedDict()  # Nom de fichier -> contenu gzip déjà écrit
+recent_payloads_size = 0
+state_lock = threading.Lock()  # Protège data_dir_size et recent_payloads (collecte et thread d'envoi)
 
 def check_dependencies():
     """Vérifie les dépendances système."""
@@ -66,6 +88,13 @@ def check_dependencies():
     if missing:
         logging.warning(f"Dépendances manquantes: {', '.join(missing)}")
 
+def get_wmi(namespace: Optional[str] = None) -> Any:
+    """Retourne la connexion WMI du namespace donné, créée au premier appel."""
+    if namespace not in _wmi_connections:
+        import wmi
+        _wmi_connections[namespace] = wmi.WMI(namespace=namespace) if namespace else wmi.WMI()
+    return _wmi_connections[namespace]
+
 def get_machine_id() -> Optional[str]:
     """Récupère l'ID machine depuis le fichier."""
     try:
@@ -87,20 +116,32 @@ def save_machine_id(machine_id: str):
         logging.error(f"Erreur sauvegarde ID machine: {e}\n{traceback.format_exc()}")
 
 def get_next_filename() -> str:
-    """Trouve le prochain nom de fichier disponible."""
+    """Réserve le prochain nom de fichier (l'agent est le seul écrivain de DATA_DIR)."""
     global file_counter
-    while os.path.exists(f"{DATA_DIR}/{file_counter}.json.gz"):
-        file_counter += 1
-    return f"{DATA_DIR}/{file_counter}.json.gz"
+    filename = f"{DATA_DIR}/{file_counter}.json.gz"
+    file_counter += 1
+    return filename
+
+def file_number(filename: str) -> int:
+    """Clé de tri des fichiers de données : '10.json.gz' -> 10, ordre de collecte (-1 si non numéroté)."""
+    stem = filename.split('.', 1)[0]
+    return int(stem) if stem.isdigit() else -1
 
 def reset_file_counter():
-    """Réinitialise le compteur de fichiers."""
+    """Réinitialise le compteur après le plus grand numéro présent dans DATA_DIR."""
     global file_counter
-    file_counter = 1
-    while os.path.exists(f"{DATA_DIR}/{file_counter}.json.gz"):
-        file_counter += 1
+    numbers = (name.split('.')[0] for name in os.listdir(DATA_DIR) if name.endswith('.json.gz'))
+    file_counter = max((int(n) for n in numbers if n.isdigit()), default=0) + 1
     logging.info(f"Compteur de fichiers réinitialisé à {file_counter}")
 
+def read_sysfs(path: str) -> str:
+    """Lit un attribut /sys ou /proc, chaîne vide s'il est absent."""
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return ""
+
 def get_logged_users() -> List[Dict[str, str]]:
     """Récupère la liste des utilisateurs connectés."""
     users = []
@@ -120,32 +161,36 @@ def get_logged_users() -> List[Dict[str, str]]:
 def get_screen_resolution() -> Optional[str]:
     """Récupère la résolution d'écran."""
     try:
-        if platform.system() == "Windows":
+        if SYSTEM == "Windows":
             import ctypes
             user32 = ctypes.windll.user32
             width = user32.GetSystemMetrics(0)
             height = user32.GetSystemMetrics(1)
             return f"{width}x{height}"
-        elif platform.system() == "Linux":
-            cmd = "xrandr | grep ' connected' | head -n 1 | awk '{print $3}' | cut -d'+' -f1"
-            return subprocess.check_output(cmd, shell=True).decode().strip()
+        elif SYSTEM == "Linux":
+            output = subprocess.run(["xrandr"], capture_output=True, text=True, check=True).stdout
+            for line in output.splitlines():
+                if " connected" in line:
+                    # Ex: "eDP-1 connected primary 1920x1080+0+0 ..."
+                    return next((field.split('+')[0] for field in line.split()[2:] if '+' in field), "")
+            return ""
     except Exception as e:
         logging.error(f"Erreur résolution écran: {e}\n{traceback.format_exc()}")
         return "Non disponible"
 
+@lru_cache(maxsize=None)
 def get_machine_type() -> int:
     """Détermine si la machine est un portable (0) ou un desktop (1)."""
     try:
-        system = platform.system()
-        if system == "Windows":
+        if SYSTEM == "Windows":
             if hasattr(psutil, "sensors_battery") and psutil.sensors_battery():
                 return 0
             return 1
-        elif system == "Linux":
+        elif SYSTEM == "Linux":
             if os.path.exists("/sys/class/power_supply/BAT0") or os.path.exists("/sys/class/power_supply/BAT1"):
                 return 0
             return 1
-        elif system == "Darwin":
+        elif SYSTEM == "Darwin":
             model = subprocess.getoutput("sysctl -n hw.model")
             return 0 if "MacBook" in model else 1
         return 1
@@ -153,14 +198,25 @@ def get_machine_type() -> int:
         logging.error(f"Erreur type machine: {e}\n{traceback.format_exc()}")
         return 1
 
+def parse_dmidecode(output: str, keys: tuple) -> Dict[str, str]:
+    """Extrait en une passe les champs « Clé: valeur » demandés (première occurrence)."""
+    fields = {}
+    for line in output.splitlines():
+        key, sep, value = line.strip().partition(":")
+        if sep and key in keys and key not in fields:
+            fields[key] = value.strip()
+    return fields
+
 def get_bios_motherboard_info() -> Dict[str, Any]:
     """Récupère les informations BIOS et carte mère."""
+    global _bios_info
+    if _bios_info is not None:
+        return _bios_info
     bios_info = {"BIOS": {"Fabricant": "Non disponible", "Version": "Non disponible", "Date": "Non disponible"},
                  "Carte mère": {"Fabricant": "Non disponible", "Modèle": "Non disponible"}}
     try:
-        if platform.system() == "Windows":
-            import wmi
-            c = wmi.WMI()
+        if SYSTEM == "Windows":
+            c = get_wmi()
             for bios in c.Win32_BIOS():
                 bios_info["BIOS"] = {
                     "Fabricant": bios.Manufacturer,
@@ -172,38 +228,36 @@ def get_bios_motherboard_info() -> Dict[str, Any]:
                     "Fabricant": board.Manufacturer,
                     "Modèle": board.Product
                 }
-        elif platform.system() == "Linux":
+        elif SYSTEM == "Linux":
             # Utiliser /sys/class/dmi/id/ pour éviter les permissions root
-            if os.path.exists('/sys/class/dmi/id/bios_vendor'):
-                with open('/sys/class/dmi/id/bios_vendor', 'r') as f:
-                    bios_info["BIOS"]["Fabricant"] = f.read().strip()
-            if os.path.exists('/sys/class/dmi/id/bios_version'):
-                with open('/sys/class/dmi/id/bios_version', 'r') as f:
-                    bios_info["BIOS"]["Version"] = f.read().strip()
-            if os.path.exists('/sys/class/dmi/id/bios_date'):
-                with open('/sys/class/dmi/id/bios_date', 'r') as f:
-                    bios_info["BIOS"]["Date"] = f.read().strip()
-            if os.path.exists('/sys/class/dmi/id/board_vendor'):
-                with open('/sys/class/dmi/id/board_vendor', 'r') as f:
-                    bios_info["Carte mère"]["Fabricant"] = f.read().strip()
-            if os.path.exists('/sys/class/dmi/id/board_name'):
-                with open('/sys/class/dmi/id/board_name', 'r') as f:
-                    bios_info["Carte mère"]["Modèle"] = f.read().strip()
-            # Essayer dmidecode en dernier recours
+            for section, field, attribute in (("BIOS", "Fabricant", "bios_vendor"),
+                                              ("BIOS", "Version", "bios_version"),
+                                              ("BIOS", "Date", "bios_date"),
+                                              ("Carte mère", "Fabricant", "board_vendor"),
+                                              ("Carte mère", "Modèle", "board_name")):
+                value = read_sysfs(f"/sys/class/dmi/id/{attribute}")
+                if value:
+                    bios_info[section][field] = value
+            # Essayer dmidecode en dernier recours, uniquement pour les champs manquants
             try:
-                bios_output = subprocess.check_output("dmidecode -t bios", shell=True, stderr=subprocess.DEVNULL).decode()
-                bios_info["BIOS"] = {
-                    "Fabricant": next((line.split("Vendor:")[1].strip() for line in bios_output.splitlines() if "Vendor:" in line), bios_info["BIOS"]["Fabricant"]),
-                    "Version": next((line.split("Version:")[1].strip() for line in bios_output.splitlines() if "Version:" in line), bios_info["BIOS"]["Version"]),
-                    "Date": next((line.split("Release Date:")[1].strip() for line in bios_output.splitlines() if "Release Date:" in line), bios_info["BIOS"]["Date"])
-                }
-                board_output = subprocess.check_output("dmidecode -t baseboard", shell=True, stderr=subprocess.DEVNULL).decode()
-                bios_info["Carte mère"] = {
-                    "Fabricant": next((line.split("Manufacturer:")[1].strip() for line in board_output.splitlines() if "Manufacturer:" in line), bios_info["Carte mère"]["Fabricant"]),
-                    "Modèle": next((line.split("Product Name:")[1].strip() for line in board_output.splitlines() if "Product Name:" in line), bios_info["Carte mère"]["Modèle"])
-                }
+                if "Non disponible" in bios_info["BIOS"].values():
+                    bios_output = subprocess.check_output("dmidecode -t bios", shell=True, stderr=subprocess.DEVNULL).decode()
+                    fields = parse_dmidecode(bios_output, ("Vendor", "Version", "Release Date"))
+                    bios_info["BIOS"] = {
+                        "Fabricant": fields.get("Vendor", bios_info["BIOS"]["Fabricant"]),
+                        "Version": fields.get("Version", bios_info["BIOS"]["Version"]),
+                        "Date": fields.get("Release Date", bios_info["BIOS"]["Date"])
+                    }
+                if "Non disponible" in bios_info["Carte mère"].values():
+                    board_output = subprocess.check_output("dmidecode -t baseboard", shell=True, stderr=subprocess.DEVNULL).decode()
+                    fields = parse_dmidecode(board_output, ("Manufacturer", "Product Name"))
+                    bios_info["Carte mère"] = {
+                        "Fabricant": fields.get("Manufacturer", bios_info["Carte mère"]["Fabricant"]),
+                        "Modèle": fields.get("Product Name", bios_info["Carte mère"]["Modèle"])
+                    }
             except (subprocess.CalledProcessError, PermissionError):
                 logging.warning("dmidecode non accessible, utilisant valeurs par défaut")
+        _bios_info = bios_info
     except Exception as e:
         logging.error(f"Erreur BIOS: {e}\n{traceback.format_exc()}")
     return bios_info
@@ -212,18 +266,20 @@ def get_usb_devices() -> List[Dict[str, str]]:
     """Récupère les périphériques USB."""
     usb_devices = []
     try:
-        if platform.system() == "Windows":
-            import wmi
-            c = wmi.WMI()
+        if SYSTEM == "Windows":
+            c = get_wmi()
             for device in c.Win32_USBControllerDevice():
                 dependent = device.Dependent
                 if dependent and hasattr(dependent, 'Description'):
                     usb_devices.append({"Description": dependent.Description})
-        elif platform.system() == "Linux":
-            usb_output = subprocess.check_output("lsusb", shell=True).decode()
-            for line in usb_output.strip().split('\n'):
-                if line:
-                    usb_devices.append({"Description": line})
+        elif SYSTEM == "Linux":
+            # Même format que lsusb, construit depuis /sys sans lancer de processus
+            for device_dir in sorted(os.path.dirname(p) for p in glob.glob("/sys/bus/usb/devices/*/idVendor")):
+                attrs = {key: read_sysfs(f"{device_dir}/{key}")
+                         for key in ("busnum", "devnum", "idVendor", "idProduct", "manufacturer", "product")}
+                name = " ".join(filter(None, (attrs["manufacturer"], attrs["product"])))
+                usb_devices.append({"Description": f"Bus {int(attrs['busnum'] or 0):03d} Device {int(attrs['devnum'] or 0):03d}: "
+                                                   f"ID {attrs['idVendor']}:{attrs['idProduct']} {name}".rstrip()})
     except Exception as e:
         logging.error(f"Erreur USB: {e}\n{traceback.format_exc()}")
     return usb_devices
@@ -251,6 +307,7 @@ def get_network_interfaces() -> List[Dict[str, Any]]:
     """Récupère les interfaces réseau."""
     network_interfaces = []
     try:
+        stats_map = psutil.net_if_stats()
         for name, addrs in psutil.net_if_addrs().items():
             interface_info = {"nom": name, "adresses": []}
             for addr in addrs:
@@ -266,8 +323,8 @@ def get_network_interfaces() -> List[Dict[str, Any]]:
                     address_info["adresse"] = addr.address
                 if address_info:
                     interface_info["adresses"].append(address_info)
-            if name in psutil.net_if_stats():
-                stats = psutil.net_if_stats()[name]
+            stats = stats_map.get(name)
+            if stats is not None:
                 interface_info["statut"] = "Up" if stats.isup else "Down"
                 interface_info["vitesse"] = f"{stats.speed} Mbps"
             network_interfaces.append(interface_info)
@@ -275,14 +332,22 @@ def get_network_interfaces() -> List[Dict[str, Any]]:
         logging.error(f"Erreur interfaces réseau: {e}\n{traceback.format_exc()}")
     return network_interfaces
 
+def set_internet_status(connected: bool):
+    """Enregistre l'état de la connexion observé (test ou envoi au serveur)."""
+    global net_ok, net_checked_at
+    net_ok, net_checked_at = connected, time.time()
+
 def is_internet_connected() -> bool:
-    """Vérifie la connexion Internet."""
+    """Vérifie la connexion Internet, en réutilisant le dernier état connu s'il est récent."""
+    if time.time() - net_checked_at < NET_PROBE_INTERVAL:
+        return net_ok
     try:
-        socket.create_connection(("8.8.8.8", 53), timeout=3)
-        return True
+        with socket.create_connection(("8.8.8.8", 53), timeout=3):
+            set_internet_status(True)
     except OSError as e:
         logging.error(f"Erreur connexion Internet: {e}\n{traceback.format_exc()}")
-        return False
+        set_internet_status(False)
+    return net_ok
 
 def get_disk_partitions() -> List[Dict[str, Any]]:
     """Récupère les partitions de disque."""
@@ -317,10 +382,12 @@ def get_disk_partitions() -> List[Dict[str, Any]]:
 def bytes_to_human_readable(bytes_value: int) -> str:
     """Convertit les octets en format lisible."""
     try:
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if bytes_value < 1024.0 or unit == 'TB':
-                return f"{bytes_value:.2f} {unit}"
-            bytes_value /= 1024.0
+        bytes_value = int(bytes_value)
+        if bytes_value <= 0:
+            return f"0.00 {UNITS[0]}"
+        # Indice de l'unité tiré du nombre de bits (1024 = 2**10), sans boucle de divisions
+        idx = min((bytes_value.bit_length() - 1) // 10, len(UNITS) - 1)
+        return f"{bytes_value / (1 << (idx * 10)):.2f} {UNITS[idx]}"
     except Exception as e:
         logging.error(f"Erreur conversion octets: {e}\n{traceback.format_exc()}")
         return "Non disponible"
@@ -328,18 +395,23 @@ def bytes_to_human_readable(bytes_value: int) -> str:
 def get_cpu_temperature() -> Optional[float]:
     """Récupère la température CPU."""
     try:
-        if platform.system() == "Linux":
-            try:
-                output = subprocess.check_output(["sensors"], universal_newlines=True)
-                for line in output.split("\n"):
-                    if "Core" in line and "°C" in line:
-                        return float(line.split("+")[1].split("°C")[0].strip())
-            except:
-                with open("/sys/class/thermal/thermal_zone0/temp", "r") as f:
-                    return float(f.read().strip()) / 1000.0
-        elif platform.system() == "Windows":
-            import wmi
-            w = wmi.WMI(namespace="root\\wmi")
+        if SYSTEM == "Linux":
+            # Lecture directe des zones thermiques du CPU (ordre numérique), sensors en dernier recours
+            zones = glob.glob("/sys/class/thermal/thermal_zone*")
+            for zone in sorted(zones, key=lambda z: int(z.rsplit("thermal_zone", 1)[1] or -1) if z[-1].isdigit() else -1):
+                zone_type = read_sysfs(f"{zone}/type").lower()
+                if not any(name in zone_type for name in CPU_THERMAL_TYPES):
+                    continue
+                try:
+                    return float(read_sysfs(f"{zone}/temp")) / 1000.0
+                except ValueError:
+                    continue
+            output = subprocess.check_output(["sensors"], universal_newlines=True)
+            for line in output.split("\n"):
+                if "Core" in line and "°C" in line:
+                    return float(line.split("+")[1].split("°C")[0].strip())
+        elif SYSTEM == "Windows":
+            w = get_wmi("root\\wmi")
             return (w.MSAcpi_ThermalZoneTemperature()[0].CurrentTemperature / 10.0) - 273.15
     except Exception as e:
         logging.error(f"Erreur température CPU: {e}\n{traceback.format_exc()}")
@@ -371,11 +443,13 @@ def get_battery_info() -> Dict[str, Any]:
         logging.error(f"Erreur batterie: {e}\n{traceback.format_exc()}")
     return battery_info
 
-def check_resource_threshold() -> Dict[str, Any]:
-    """Vérifie si le seuil d'utilisation est atteint."""
+def check_resource_threshold(cpu_percent: Optional[float] = None, timestamp: Optional[str] = None) -> Dict[str, Any]:
+    """Vérifie si le seuil d'utilisation est atteint (cpu_percent, timestamp : valeurs déjà calculées)."""
     threshold_reached = {"cpu": False, "memory": False, "disk": False, "timestamp": None}
     try:
-        if psutil.cpu_percent(interval=0.1) > RESOURCE_THRESHOLD:
+        if cpu_percent is None:
+            cpu_percent = psutil.cpu_percent(interval=None)
+        if cpu_percent > RESOURCE_THRESHOLD:
             threshold_reached["cpu"] = True
         memory = psutil.virtual_memory()
         if memory.percent > RESOURCE_THRESHOLD:
@@ -384,7 +458,7 @@ def check_resource_threshold() -> Dict[str, Any]:
         if disk.percent > RESOURCE_THRESHOLD:
             threshold_reached["disk"] = True
         if any(threshold_reached.values()):
-            threshold_reached["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            threshold_reached["timestamp"] = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     except Exception as e:
         logging.error(f"Erreur seuils: {e}\n{traceback.format_exc()}")
     return threshold_reached
@@ -393,20 +467,21 @@ def collect_initial_data() -> Dict[str, Any]:
     """Collecte les données initiales."""
     try:
         os_info = {
-            "nom": platform.system(),
+            "nom": SYSTEM,
             "version": platform.version(),
             "release": platform.release(),
             "architecture": platform.machine(),
             "hostname": platform.node()
         }
+        freq = psutil.cpu_freq()
         cpu_info = {
             "type": platform.processor(),
             "coeurs_physiques": psutil.cpu_count(logical=False),
             "coeurs_logiques": psutil.cpu_count(logical=True),
             "frequence": {
-                "actuelle": psutil.cpu_freq().current if psutil.cpu_freq() else "Non disponible",
-                "min": psutil.cpu_freq().min if psutil.cpu_freq() else "Non disponible",
-                "max": psutil.cpu_freq().max if psutil.cpu_freq() else "Non disponible"
+                "actuelle": freq.current if freq else "Non disponible",
+                "min": freq.min if freq else "Non disponible",
+                "max": freq.max if freq else "Non disponible"
             }
         }
         memory = psutil.virtual_memory()
@@ -441,8 +516,8 @@ def collect_initial_data() -> Dict[str, Any]:
             "partitions_disque": get_disk_partitions(),
             "peripheriques_usb": get_usb_devices(),
             "battery_initial": get_battery_info(),
-            "heure_demarrage_systeme": system_boot_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "heure_demarrage_script": script_start_time.strftime("%Y-%m-%d %H:%M:%S")
+            "heure_demarrage_systeme": system_boot_time_str,
+            "heure_demarrage_script": script_start_time_str
         }
     except Exception as e:
         logging.error(f"Erreur collecte initiale: {e}\n{traceback.format_exc()}")
@@ -451,7 +526,9 @@ def collect_initial_data() -> Dict[str, Any]:
 def collect_variable_data() -> Dict[str, Any]:
     """Collecte les données variables."""
     try:
-        cpu_per_core = psutil.cpu_percent(interval=0.1, percpu=True)
+        # Non bloquant : utilisation depuis l'appel précédent (amorcé au démarrage)
+        cpu_per_core = psutil.cpu_percent(interval=None, percpu=True)
+        cpu_global = sum(cpu_per_core) / len(cpu_per_core) if cpu_per_core else 0
         cpu_cores_data = [{"core": i, "utilisation": p} for i, p in enumerate(cpu_per_core)]
         memory = psutil.virtual_memory()
         swap = psutil.swap_memory()
@@ -469,10 +546,13 @@ def collect_variable_data() -> Dict[str, Any]:
             except Exception as e:
                 logging.error(f"Erreur GPU: {e}\n{traceback.format_exc()}")
         net_io = psutil.net_io_counters()
+        # Un seul horodatage par collecte, réutilisé par tous les champs
+        now = datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
         return {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "timestamp": timestamp,
             "cpu": {
-                "global_utilise": sum(cpu_per_core) / len(cpu_per_core) if cpu_per_core else 0,
+                "global_utilise": cpu_global,
                 "par_coeur": cpu_cores_data,
                 "temperature": get_cpu_temperature()
             },
@@ -499,24 +579,51 @@ def collect_variable_data() -> Dict[str, Any]:
             "connexion_internet": is_internet_connected(),
             "nombre_processus": len(psutil.pids()),
             "battery": get_battery_info(),
-            "uptime": str(timedelta(seconds=time.time() - psutil.boot_time())),
-            "seuil_atteint": check_resource_threshold()
+            "uptime": str(now - system_boot_time),
+            "seuil_atteint": check_resource_threshold(cpu_global, timestamp)
         }
     except Exception as e:
         logging.error(f"Erreur collecte variable: {e}\n{traceback.format_exc()}")
         return {"error": str(e)}
 
+def write_data_file(file_path: str, payload: bytes):
+    """Écrit un fichier de données et le garde en mémoire pour l'envoyer sans le relire."""
+    global data_dir_size, recent_payloads_size
+    # Écriture sous un nom temporaire puis renommage : le thread d'envoi ne voit
+    # jamais un fichier .json.gz incomplet
+    with open(f"{file_path}.tmp", 'wb') as f:
+        f.write(payload)
+    os.replace(f"{file_path}.tmp", file_path)
+    with state_lock:
+        data_dir_size += len(payload)
+        recent_payloads[os.path.basename(file_path)] = payload
+        recent_payloads_size += len(payload)
+        # Au-delà de la limite, les plus anciens seront relus depuis le disque
+        while recent_payloads_size > PAYLOAD_CACHE_LIMIT:
+            _, oldest = recent_payloads.popitem(last=False)
+            recent_payloads_size -= len(oldest)
+
+def remove_data_file(filename: str, file_path: str, size: int):
+    """Supprime un fichier envoyé et le retire du cache mémoire."""
+    global data_dir_size, recent_payloads_size
+    os.remove(file_path)
+    with state_lock:
+        data_dir_size -= size
+        payload = recent_payloads.pop(filename, None)
+        if payload is not None:
+            recent_payloads_size -= len(payload)
+
 def save_initial_data():
     """Sauvegarde les données initiales dans 1.json.gz."""
-    global initial_data_saved
+    global initial_data_saved, file_counter
     if initial_data_saved or os.path.exists(f"{DATA_DIR}/1.json.gz"):
         logging.info("Données initiales déjà sauvegardées")
         return
     try:
         initial_data = collect_initial_data()
-        with gzip.open(f"{DATA_DIR}/1.json.gz", 'wt', encoding='utf-8') as f:
-            json.dump(initial_data, f, ensure_ascii=False, indent=2)
+        write_data_file(f"{DATA_DIR}/1.json.gz", gzip.compress(orjson.dumps(initial_data), compresslevel=GZIP_LEVEL))
         initial_data_saved = True
+        file_counter = max(file_counter, 2)  # 1.json.gz est réservé aux données initiales
         logging.info("Données initiales sauvegardées")
     except Exception as e:
         logging.error(f"Erreur sauvegarde initiale: {e}\n{traceback.format_exc()}")
@@ -525,8 +632,7 @@ def save_variable_data_to_file(data: Dict[str, Any]) -> Optional[str]:
     """Sauvegarde les données variables dans un fichier compressé."""
     try:
         filename = get_next_filename()
-        with gzip.open(filename, 'wt', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        write_data_file(filename, gzip.compress(orjson.dumps(data), compresslevel=GZIP_LEVEL))
         logging.info(f"Données variables sauvegardées dans {filename}")
         return filename
     except Exception as e:
@@ -535,7 +641,7 @@ def save_variable_data_to_file(data: Dict[str, Any]) -> Optional[str]:
 
 def initialize_data_collection():
     """Initialise la collecte de données."""
-    global initial_data_saved, file_counter
+    global initial_data_saved, file_counter, data_dir_size
     try:
         if not os.path.exists(DATA_DIR):
             os.makedirs(DATA_DIR)
@@ -544,70 +650,148 @@ def initialize_data_collection():
         else:
             initial_data_saved = False
         reset_file_counter()
+        data_dir_size = get_data_directory_size()
+        # Amorce la mesure CPU non bloquante de collect_variable_data
+        psutil.cpu_percent(interval=None, percpu=True)
     except Exception as e:
         logging.error(f"Erreur initialisation collecte: {e}\n{traceback.format_exc()}")
 
+def close_server_connection():
+    """Ferme la connexion persistante au serveur."""
+    global server_sock, server_reader
+    for stream in (server_reader, server_sock):
+        if stream is not None:
+            try:
+                stream.close()
+            except OSError:
+                pass
+    server_sock = server_reader = None
+
+def is_connection_alive(sock: socket.socket) -> bool:
+    """Vérifie qu'une connexion inactive n'a pas été fermée par le serveur."""
+    try:
+        # Aucune réponse n'est attendue entre deux envois : une socket lisible
+        # signale une fermeture (EOF) ou une erreur
+        readable, _, _ = select.select([sock], [], [], 0)
+        return not readable
+    except (OSError, ValueError):
+        return False
+
+def get_server_connection():
+    """Retourne la connexion au serveur (socket, lecteur de réponses), rouverte si nécessaire."""
+    global server_sock, server_reader
+    if server_sock is not None and not is_connection_alive(server_sock):
+        logging.info("Connexion au serveur fermée, reconnexion")
+        close_server_connection()
+    if server_sock is None:
+        try:
+            sock = socket.create_connection((SERVER_HOST, SERVER_PORT), timeout=5)
+        except OSError:
+            set_internet_status(False)
+            raise
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        server_sock, server_reader = sock, sock.makefile('rb')
+        logging.info(f"Connecté au serveur {SERVER_HOST}:{SERVER_PORT}")
+    set_internet_status(True)
+    return server_sock, server_reader
+
 @backoff.on_exception(backoff.expo, (socket.timeout, ConnectionRefusedError, ConnectionResetError, BrokenPipeError), max_tries=5)
 def send_files_to_server() -> Optional[str]:
     """Envoie les fichiers JSON au serveur."""
     machine_id = get_machine_id()
-    json_files = sorted([f for f in os.listdir(DATA_DIR) if f.endswith('.json.gz')])
+    with os.scandir(DATA_DIR) as entries:
+        file_paths = {e.name: e.path for e in entries if e.name.endswith('.json.gz')}
+    json_files = sorted(file_paths, key=file_number)
     if not json_files:
         logging.info("Aucun fichier à envoyer")
         return machine_id
 
     # Prioritize sending 1.json.gz first
     if "1.json.gz" in json_files and not machine_id:
-        json_files = ["1.json.gz"] + [f for f in json_files if f != "1.json.gz"]
+        json_files.remove("1.json.gz")
+        json_files.insert(0, "1.json.gz")
 
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-            client_socket.settimeout(5)
-            client_socket.connect((SERVER_HOST, SERVER_PORT))
-            logging.info(f"Connecté au serveur {SERVER_HOST}:{SERVER_PORT}")
-
-            for i, json_file in enumerate(json_files):
-                file_path = os.path.join(DATA_DIR, json_file)
+        client_socket, responses = get_server_connection()
+        pending = deque(json_files)
+        static_resent = False
+        while pending:
+            # Les fichiers partent par lots sans attendre chaque réponse ; 1.json.gz
+            # part seul car sa réponse fournit l'ID machine des fichiers suivants
+            batch_size = 1 if pending[0] == "1.json.gz" else FILES_PER_BATCH
+            in_flight = []
+            sent_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            for json_file in [pending.popleft() for _ in range(min(batch_size, len(pending)))]:
+                file_path = file_paths[json_file]
                 try:
-                    with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                        file_data = f.read()
-                    json_data = json.loads(file_data)
-                    data_to_send = {
+                    with state_lock:
+                        payload = recent_payloads.get(json_file)
+                    if payload is None:
+                        with open(file_path, 'rb') as f:
+                            payload = f.read()
+                    if not payload:
+                        logging.warning(f"Fichier {json_file} vide, ignoré")
+                        continue
+                    # En-tête JSON sur une ligne, suivi du fichier tel quel (déjà
+                    # compressé) : le serveur se charge de la décompression
+                    header = orjson.dumps({
                         "version": "1.0",
                         "filename": json_file,
-                        "content": json_data,
                         "machine_id": machine_id,
-                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    client_socket.sendall(f"{json.dumps(data_to_send)}\n".encode('utf-8'))
-                    response = client_socket.recv(1024).decode('utf-8').strip()
-                    response_data = json.loads(response)
-
-                    if response_data.get("status") == "success":
-                        if json_file == "1.json.gz" and response_data.get("machine_id"):
-                            machine_id = response_data["machine_id"]
-                            save_machine_id(machine_id)
-                        logging.info(f"Fichier {json_file} envoyé, suppression")
-                        os.remove(file_path)
-                    elif response_data.get("message") == "RESEND_STATIC_DATA":
-                        logging.warning(f"Machine non identifiée pour {json_file}, envoi de 1.json.gz requis")
-                        if json_file != "1.json.gz" and os.path.exists(f"{DATA_DIR}/1.json.gz"):
-                            json_files.insert(0, "1.json.gz")  # Retry with static data
-                            continue
-                    else:
-                        logging.warning(f"Erreur envoi {json_file}: {response_data.get('message')}")
-
-                    if (i + 1) % FILES_PER_BATCH == 0:
-                        logging.info(f"Pause de {BATCH_PAUSE}s après {FILES_PER_BATCH} fichiers")
-                        time.sleep(BATCH_PAUSE)
-                except (ConnectionResetError, BrokenPipeError) as e:
-                    logging.error(f"Erreur réseau lors de l'envoi de {json_file}: {e}\n{traceback.format_exc()}")
-                    break
+                        "timestamp": sent_at,
+                        "gz_len": len(payload)
+                    })
+                    client_socket.sendall(header + b"\n" + payload)
+                    in_flight.append((json_file, file_path, len(payload)))
+                except (ConnectionResetError, BrokenPipeError, socket.timeout):
+                    raise
                 except Exception as e:
                     logging.error(f"Erreur envoi {json_file}: {e}\n{traceback.format_exc()}")
 
-            return machine_id
+            retry = []
+            for json_file, file_path, size in in_flight:
+                response = responses.readline()
+                if not response:
+                    raise ConnectionResetError("Connexion fermée par le serveur")
+                response_data = orjson.loads(response)
+
+                if response_data.get("status") == "success":
+                    if json_file == "1.json.gz" and response_data.get("machine_id"):
+                        machine_id = response_data["machine_id"]
+                        save_machine_id(machine_id)
+                    logging.info(f"Fichier {json_file} envoyé, suppression")
+                    try:
+                        remove_data_file(json_file, file_path, size)
+                    except OSError as e:
+                        # Ne pas abandonner le lot : les réponses suivantes restent à lire
+                        logging.error(f"Erreur suppression {json_file}: {e}\n{traceback.format_exc()}")
+                elif response_data.get("message") == "RESEND_STATIC_DATA":
+                    logging.warning(f"Machine non identifiée pour {json_file}, envoi de 1.json.gz requis")
+                    if json_file != "1.json.gz" and not static_resent and "1.json.gz" in file_paths:
+                        retry.append(json_file)
+                else:
+                    logging.warning(f"Erreur envoi {json_file}: {response_data.get('message')}")
+
+            if retry:
+                # Renvoyer les données statiques, puis les fichiers refusés
+                static_resent = True
+                if "1.json.gz" in pending:
+                    pending.remove("1.json.gz")
+                pending.extendleft(reversed(["1.json.gz"] + retry))
+            elif len(in_flight) == FILES_PER_BATCH and pending:
+                logging.info(f"Pause de {BATCH_PAUSE}s après {FILES_PER_BATCH} fichiers")
+                time.sleep(BATCH_PAUSE)
+
+        return machine_id
+    except (ConnectionResetError, BrokenPipeError, socket.timeout) as e:
+        close_server_connection()
+        set_internet_status(False)
+        logging.error(f"Erreur réseau lors de l'envoi: {e}\n{traceback.format_exc()}")
+        return machine_id
     except Exception as e:
+        # Réponses éventuellement non lues : repartir d'une connexion neuve
+        close_server_connection()
         logging.error(f"Erreur connexion serveur: {e}\n{traceback.format_exc()}")
         return machine_id
 
@@ -615,9 +799,8 @@ def get_data_directory_size() -> int:
     """Calcule la taille du répertoire de données."""
     total_size = 0
     try:
-        for filename in os.listdir(DATA_DIR):
-            if filename.endswith('.json.gz'):
-                total_size += os.path.getsize(os.path.join(DATA_DIR, filename))
+        with os.scandir(DATA_DIR) as entries:
+            total_size = sum(e.stat().st_size for e in entries if e.name.endswith('.json.gz'))
     except Exception as e:
         logging.error(f"Erreur calcul taille répertoire: {e}\n{traceback.format_exc()}")
     return total_size
@@ -625,43 +808,60 @@ def get_data_directory_size() -> int:
 def is_storage_limit_reached() -> bool:
     """Vérifie si la limite de stockage est atteinte."""
     try:
-        if get_data_directory_size() >= STORAGE_LIMIT:
-            logging.warning(f"Limite de stockage atteinte: {bytes_to_human_readable(get_data_directory_size())}")
+        if data_dir_size >= STORAGE_LIMIT:
+            logging.warning(f"Limite de stockage atteinte: {bytes_to_human_readable(data_dir_size)}")
             return True
         return False
     except Exception as e:
         logging.error(f"Erreur vérification stockage: {e}\n{traceback.format_exc()}")
         return False
 
+def sender_loop(stop_event: threading.Event):
+    """Envoie les fichiers toutes les SEND_INTERVAL secondes, en parallèle de la collecte."""
+    while not stop_event.wait(SEND_INTERVAL):
+        try:
+            send_files_to_server()
+        except Exception as e:
+            logging.error(f"Erreur thread d'envoi: {e}\n{traceback.format_exc()}")
+
 def continuous_collection():
     """Collecte continue des données."""
+    stop_event = threading.Event()
+    sender = threading.Thread(target=sender_loop, args=(stop_event,), name="sender", daemon=True)
     try:
         check_dependencies()
         initialize_data_collection()
         machine_id = get_machine_id()
-        last_send_time = time.time()
 
         if not machine_id:
             save_initial_data()
             machine_id = send_files_to_server()
 
+        # L'envoi tourne dans son propre thread : un serveur lent ou injoignable
+        # ne crée plus de trous dans la série de mesures
+        sender.start()
+        next_collection = time.monotonic()
         while True:
             if is_storage_limit_reached():
                 logging.warning("Limite de stockage atteinte, arrêt")
                 break
             if not initial_data_saved:
                 save_initial_data()
+            if not machine_id:
+                machine_id = get_machine_id()  # Obtenu entre-temps par le thread d'envoi
             if machine_id:
                 variable_data = collect_variable_data()
                 if variable_data and "error" not in variable_data:
                     save_variable_data_to_file(variable_data)
-            current_time = time.time()
-            if current_time - last_send_time >= SEND_INTERVAL:
-                machine_id = send_files_to_server()
-                last_send_time = current_time
-            time.sleep(COLLECTION_INTERVAL)
+            # Cadence fixe, quelle que soit la durée de la collecte
+            next_collection = max(next_collection + COLLECTION_INTERVAL, time.monotonic())
+            time.sleep(max(0.0, next_collection - time.monotonic()))
     except Exception as e:
         logging.error(f"Erreur collecte continue: {e}\n{traceback.format_exc()}")
+    finally:
+        stop_event.set()
+        if sender.is_alive():
+            sender.join()
 
 if __name__ == "__main__":
     try:
@@ -6,11 +6,14 @@ Covers machine types, OS, CPU, RAM, disk, BIOS, GPU, network interfaces, battery
 """
 
 import re
+import pymongo
 from pymongo import MongoClient
 import logging
 from typing import Dict, List, Tuple
 from collections import defaultdict
+from functools import lru_cache
 import traceback
+import sys
 
 # Configuration du logging
 logging.basicConfig(
@@ -28,51 +31,89 @@ MONGO_PORT = 27017
 DATABASE_NAME = 'machine_monitoring'
 STATIC_COLLECTION = 'static_data'
 
+# Value formats produced by the agent
+MEMORY_RE = re.compile(r'(\d+\.?\d*)\s*(GB|MB|TB)', re.IGNORECASE)
+NETWORK_SPEED_RE = re.compile(r'(\d+\.?\d*)\s*(Mbps|Gbps)', re.IGNORECASE)
+
+@lru_cache(maxsize=4096)
 def parse_memory_size(memory_str: str) -> float:
     """Convert memory string (e.g., '7.68 GB') to GB as float."""
-    try:
-        if not memory_str or memory_str == 'Non disponible':
-            return 0.0
-        match = re.match(r'(\d+\.?\d*)\s*(GB|MB|TB)', memory_str, re.IGNORECASE)
-        if not match:
-            logging.warning(f"Invalid memory format: {memory_str}")
-            return 0.0
-        value, unit = float(match.group(1)), match.group(2).upper()
-        if unit == 'MB':
-            return value / 1024.0
-        elif unit == 'TB':
-            return value * 1024.0
-        return value
-    except Exception as e:
-        logging.error(f"Error parsing memory size '{memory_str}': {e}\n{traceback.format_exc()}")
+    if not memory_str or memory_str == 'Non disponible':
+        return 0.0
+    match = MEMORY_RE.match(memory_str) if isinstance(memory_str, str) else None
+    if not match:
+        logging.warning("Invalid memory format: %s", memory_str)
         return 0.0
+    value, unit = float(match.group(1)), match.group(2).upper()
+    if unit == 'MB':
+        return value / 1024.0
+    elif unit == 'TB':
+        return value * 1024.0
+    return value
 
 def parse_frequency(freq: str) -> float:
     """Convert frequency string (e.g., '1800') to MHz as float."""
+    if not freq or freq == 'Non disponible':
+        return 0.0
     try:
-        if not freq or freq == 'Non disponible':
-            return 0.0
         return float(freq)
-    except Exception as e:
-        logging.error(f"Error parsing frequency '{freq}': {e}\n{traceback.format_exc()}")
+    except (TypeError, ValueError) as e:
+        logging.error("Error parsing frequency '%s': %s", freq, e)
         return 0.0
 
+@lru_cache(maxsize=4096)
 def parse_network_speed(speed_str: str) -> float:
     """Convert network speed string (e.g., '1000 Mbps') to Mbps as float."""
-    try:
-        if not speed_str or speed_str == 'Non disponible':
-            return 0.0
-        match = re.match(r'(\d+\.?\d*)\s*(Mbps|Gbps)', speed_str, re.IGNORECASE)
-        if not match:
-            logging.warning(f"Invalid network speed format: {speed_str}")
-            return 0.0
-        value, unit = float(match.group(1)), match.group(2).upper()
-        if unit == 'Gbps':
-            return value * 1000.0
-        return value
-    except Exception as e:
-        logging.error(f"Error parsing network speed '{speed_str}': {e}\n{traceback.format_exc()}")
+    if not speed_str or speed_str == 'Non disponible':
+        return 0.0
+    match = NETWORK_SPEED_RE.match(speed_str) if isinstance(speed_str, str) else None
+    if not match:
+        logging.warning("Invalid network speed format: %s", speed_str)
         return 0.0
+    value, unit = float(match.group(1)), match.group(2).upper()
+    if unit == 'GBPS':
+        return value * 1000.0
+    return value
+
+def bucket_100(value: float) -> int:
+    """Round a non-negative value to the nearest multiple of 100, halves rounding up."""
+    return (int(value) + 50) // 100 * 100
+
+def group_by(key) -> List[Dict]:
+    """$facet branch counting machines per distinct value of `key` (a field path or a document of paths)."""
+    return [{'$group': {'_id': key, 'n': {'$sum': 1}}}]
+
+# Single-pass aggregation: one branch per analyzed field, fed only the leaves it reads
+STATIC_PIPELINE = [
+    {'$project': {
+        '_id': 0,
+        'type_machine': 1,
+        'os.nom': 1, 'os.version': 1, 'os.release': 1,
+        'cpu.coeurs_physiques': 1, 'cpu.coeurs_logiques': 1,
+        'cpu.frequence.min': 1, 'cpu.frequence.max': 1, 'cpu.frequence.actuelle': 1,
+        'memoire.ram.total': 1,
+        'disque.total': 1,
+        'bios_carte_mere.BIOS.Fabricant': 1, 'bios_carte_mere.Carte mère.Fabricant': 1,
+        'gpu.Disponible': 1, 'gpu.Nom': 1, 'gpu.RAM': 1,
+        'interfaces_reseau.vitesse': 1,
+        'battery_initial.has_battery': 1
+    }},
+    {'$facet': {
+        'machine_types': group_by('$type_machine'),
+        'os': group_by({'nom': '$os.nom', 'version': '$os.version', 'release': '$os.release'}),
+        'ram': group_by('$memoire.ram.total'),
+        'cores': group_by({'physical': '$cpu.coeurs_physiques', 'logical': '$cpu.coeurs_logiques'}),
+        'frequency': group_by({'min': '$cpu.frequence.min', 'max': '$cpu.frequence.max', 'current': '$cpu.frequence.actuelle'}),
+        'disk': group_by('$disque.total'),
+        'bios': group_by({'bios': '$bios_carte_mere.BIOS.Fabricant', 'motherboard': '$bios_carte_mere.Carte mère.Fabricant'}),
+        'gpu': group_by({'available': '$gpu.Disponible', 'name': '$gpu.Nom', 'ram': '$gpu.RAM'}),
+        'interfaces': [
+            {'$unwind': '$interfaces_reseau'},
+            {'$group': {'_id': '$interfaces_reseau.vitesse', 'n': {'$sum': 1}}}
+        ],
+        'battery': group_by('$battery_initial.has_battery')
+    }}
+]
 
 def analyze_static_data() -> Dict:
     """Analyze static data from MongoDB and return comprehensive statistics."""
@@ -131,151 +172,120 @@ def analyze_static_data() -> Dict:
             }
         }
 
-        # Fetch all static data
-        machines = collection.find({}, {
-            'type_machine': 1,
-            'os': 1,
-            'cpu': 1,
-            'memoire': 1,
-            'disque': 1,
-            'bios_carte_mere': 1,
-            'gpu': 1,
-            'interfaces_reseau': 1,
-            'battery_initial': 1,
-            '_id': 0
-        })
+        # Let MongoDB count machines per distinct raw value of each field; only these
+        # (value, count) pairs are shipped back and parsed, instead of every document
+        facets = next(collection.aggregate(STATIC_PIPELINE))
 
         machine_count = 0
-        ram_values = []
-        disk_values = []
-        physical_cores = []
-        logical_cores = []
-        freq_min = []
-        freq_max = []
-        freq_current = []
-        gpu_ram_values = []
-        network_speeds = []
-        network_interfaces_count = []
-
-        for machine in machines:
-            machine_count += 1
-
-            # Machine type
-            machine_type = 'laptop' if machine.get('type_machine') == 0 else 'desktop'
-            results['machine_types'][machine_type] += 1
+        for row in facets['machine_types']:
+            machine_type = 'laptop' if row['_id'] == 0 else 'desktop'
+            results['machine_types'][machine_type] += row['n']
+            machine_count += row['n']
 
-            # OS details
-            os_info = machine.get('os', {})
+        # OS details
+        for row in facets['os']:
+            os_info = row['_id']
             os_type = os_info.get('nom', 'Unknown')
             os_version = os_info.get('version', 'Unknown')
             os_release = os_info.get('release', 'Unknown')
-            results['os']['types'][os_type] += 1
-            results['os']['versions'][f"{os_type} {os_version}"] += 1
-            results['os']['releases'][f"{os_type} {os_release}"] += 1
+            results['os']['types'][os_type] += row['n']
+            results['os']['versions'][f"{os_type} {os_version}"] += row['n']
+            results['os']['releases'][f"{os_type} {os_release}"] += row['n']
 
-            # RAM
-            ram_str = machine.get('memoire', {}).get('ram', {}).get('total', '0 GB')
-            ram_gb = parse_memory_size(ram_str)
-            ram_values.append(ram_gb)
-            ram_key = round(ram_gb)
-            results['ram']['distribution'][ram_key] += 1
+        # RAM
+        ram_total = 0.0
+        for row in facets['ram']:
+            ram_gb = parse_memory_size(row['_id'])
+            ram_total += ram_gb * row['n']
+            results['ram']['distribution'][round(ram_gb)] += row['n']
 
-            # CPU
-            cpu_info = machine.get('cpu', {})
-            phys_cores = cpu_info.get('coeurs_physiques', 0) or 0
-            log_cores = cpu_info.get('coeurs_logiques', 0) or 0
-            physical_cores.append(phys_cores)
-            logical_cores.append(log_cores)
-            results['cpu']['physical_cores']['distribution'][phys_cores] += 1
-            results['cpu']['logical_cores']['distribution'][log_cores] += 1
+        # CPU
+        phys_total = log_total = 0
+        for row in facets['cores']:
+            phys_cores = row['_id'].get('physical') or 0
+            log_cores = row['_id'].get('logical') or 0
+            phys_total += phys_cores * row['n']
+            log_total += log_cores * row['n']
+            results['cpu']['physical_cores']['distribution'][phys_cores] += row['n']
+            results['cpu']['logical_cores']['distribution'][log_cores] += row['n']
 
-            # CPU Frequencies
-            freq_info = cpu_info.get('frequence', {})
-            f_min = parse_frequency(freq_info.get('min', '0'))
-            f_max = parse_frequency(freq_info.get('max', '0'))
-            f_current = parse_frequency(freq_info.get('actuelle', '0'))
-            freq_min.append(f_min)
-            freq_max.append(f_max)
-            freq_current.append(f_current)
-            results['cpu']['frequency']['min']['distribution'][round(f_min / 100) * 100] += 1
-            results['cpu']['frequency']['max']['distribution'][round(f_max / 100) * 100] += 1
-            results['cpu']['frequency']['current']['distribution'][round(f_current / 100) * 100] += 1
+        # CPU Frequencies
+        freq_totals = {'min': 0.0, 'max': 0.0, 'current': 0.0}
+        for row in facets['frequency']:
+            for key in freq_totals:
+                freq = parse_frequency(row['_id'].get(key))
+                freq_totals[key] += freq * row['n']
+                results['cpu']['frequency'][key]['distribution'][bucket_100(freq)] += row['n']
 
-            # Disk
-            disk_str = machine.get('disque', {}).get('total', '0 GB')
-            disk_gb = parse_memory_size(disk_str)
-            disk_values.append(disk_gb)
-            disk_key = round(disk_gb / 100) * 100  # Group by 100GB increments
-            results['disk']['distribution'][disk_key] += 1
+        # Disk
+        disk_total = 0.0
+        for row in facets['disk']:
+            disk_gb = parse_memory_size(row['_id'])
+            disk_total += disk_gb * row['n']
+            results['disk']['distribution'][bucket_100(disk_gb)] += row['n']  # Group by 100GB increments
 
-            # BIOS
-            bios_info = machine.get('bios_carte_mere', {})
-            bios_manufacturer = bios_info.get('BIOS', {}).get('Fabricant', 'Unknown')
-            mb_manufacturer = bios_info.get('Carte mère', {}).get('Fabricant', 'Unknown')
-            results['bios']['bios_manufacturer'][bios_manufacturer] += 1
-            results['bios']['motherboard_manufacturer'][mb_manufacturer] += 1
+        # BIOS
+        for row in facets['bios']:
+            results['bios']['bios_manufacturer'][row['_id'].get('bios', 'Unknown')] += row['n']
+            results['bios']['motherboard_manufacturer'][row['_id'].get('motherboard', 'Unknown')] += row['n']
 
-            # GPU
-            gpu_info = machine.get('gpu', {})
-            if gpu_info.get('Disponible', False):
-                results['gpu']['has_gpu'] += 1
-                gpu_name = gpu_info.get('Nom', 'Unknown')
-                results['gpu']['names'][gpu_name] += 1
-                gpu_ram_str = gpu_info.get('RAM', '0 GB')
-                gpu_ram_gb = parse_memory_size(gpu_ram_str)
-                gpu_ram_values.append(gpu_ram_gb)
-                gpu_ram_key = round(gpu_ram_gb)
-                results['gpu']['ram']['distribution'][gpu_ram_key] += 1
+        # GPU
+        gpu_ram_total = 0.0
+        for row in facets['gpu']:
+            if not row['_id'].get('available'):
+                continue
+            results['gpu']['has_gpu'] += row['n']
+            results['gpu']['names'][row['_id'].get('name', 'Unknown')] += row['n']
+            gpu_ram_gb = parse_memory_size(row['_id'].get('ram'))
+            gpu_ram_total += gpu_ram_gb * row['n']
+            results['gpu']['ram']['distribution'][round(gpu_ram_gb)] += row['n']
 
-            # Network Interfaces
-            interfaces = machine.get('interfaces_reseau', [])
-            interface_count = len(interfaces)
-            network_interfaces_count.append(interface_count)
-            total_speed = 0.0
-            for interface in interfaces:
-                speed = parse_network_speed(interface.get('vitesse', '0 Mbps'))
-                total_speed += speed
-                results['network_interfaces']['distribution'][round(speed / 100) * 100] += 1
-            network_speeds.append(total_speed)
+        # Network Interfaces (one row per distinct interface speed)
+        interface_total = 0
+        speed_total = 0.0
+        for row in facets['interfaces']:
+            speed = parse_network_speed(row['_id'])
+            interface_total += row['n']
+            speed_total += speed * row['n']
+            results['network_interfaces']['distribution'][bucket_100(speed)] += row['n']
 
-            # Battery
-            battery_info = machine.get('battery_initial', {})
-            has_battery = battery_info.get('has_battery') == 0
-            results['battery']['has_battery'] += 1 if has_battery else 0
-            results['battery']['distribution']['With Battery' if has_battery else 'No Battery'] += 1
+        # Battery
+        for row in facets['battery']:
+            has_battery = row['_id'] == 0
+            results['battery']['has_battery'] += row['n'] if has_battery else 0
+            results['battery']['distribution']['With Battery' if has_battery else 'No Battery'] += row['n']
 
         # Calculate totals and averages
         results['total_machines'] = machine_count
         if machine_count > 0:
-            results['ram']['total_gb'] = sum(ram_values)
-            results['ram']['average_gb'] = results['ram']['total_gb'] / machine_count
-            results['disk']['total_gb'] = sum(disk_values)
-            results['disk']['average_gb'] = results['disk']['total_gb'] / machine_count
-            results['cpu']['physical_cores']['total'] = sum(physical_cores)
-            results['cpu']['physical_cores']['average'] = results['cpu']['physical_cores']['total'] / machine_count
-            results['cpu']['logical_cores']['total'] = sum(logical_cores)
-            results['cpu']['logical_cores']['average'] = results['cpu']['logical_cores']['total'] / machine_count
-            results['cpu']['frequency']['min']['total'] = sum(freq_min)
-            results['cpu']['frequency']['min']['average'] = results['cpu']['frequency']['min']['total'] / machine_count
-            results['cpu']['frequency']['max']['total'] = sum(freq_max)
-            results['cpu']['frequency']['max']['average'] = results['cpu']['frequency']['max']['total'] / machine_count
-            results['cpu']['frequency']['current']['total'] = sum(freq_current)
-            results['cpu']['frequency']['current']['average'] = results['cpu']['frequency']['current']['total'] / machine_count
-            results['gpu']['ram']['total_gb'] = sum(gpu_ram_values)
-            results['gpu']['ram']['average_gb'] = results['gpu']['ram']['total_gb'] / results['gpu']['has_gpu'] if results['gpu']['has_gpu'] > 0 else 0.0
-            results['network_interfaces']['total_count'] = sum(network_interfaces_count)
-            results['network_interfaces']['total_speed_mbps'] = sum(network_speeds)
-            results['network_interfaces']['average_speed_mbps'] = results['network_interfaces']['total_speed_mbps'] / machine_count if machine_count > 0 else 0.0
+            results['ram']['total_gb'] = ram_total
+            results['ram']['average_gb'] = ram_total / machine_count
+            results['disk']['total_gb'] = disk_total
+            results['disk']['average_gb'] = disk_total / machine_count
+            results['cpu']['physical_cores']['total'] = phys_total
+            results['cpu']['physical_cores']['average'] = phys_total / machine_count
+            results['cpu']['logical_cores']['total'] = log_total
+            results['cpu']['logical_cores']['average'] = log_total / machine_count
+            for key, total in freq_totals.items():
+                results['cpu']['frequency'][key]['total'] = total
+                results['cpu']['frequency'][key]['average'] = total / machine_count
+            results['gpu']['ram']['total_gb'] = gpu_ram_total
+            results['gpu']['ram']['average_gb'] = gpu_ram_total / results['gpu']['has_gpu'] if results['gpu']['has_gpu'] > 0 else 0.0
+            results['network_interfaces']['total_count'] = interface_total
+            results['network_interfaces']['total_speed_mbps'] = speed_total
+            results['network_interfaces']['average_speed_mbps'] = speed_total / machine_count
 
-        # Convert defaultdict to regular dict
-        for key in ['os', 'ram', 'cpu', 'disk', 'bios', 'gpu', 'network_interfaces', 'battery']:
-            for subkey, value in results[key].items():
-                if isinstance(value, defaultdict):
-                    results[key][subkey] = dict(value)
-                elif isinstance(value, dict):
-                    for subsubkey, subvalue in value.items():
-                        if isinstance(subvalue, defaultdict):
-                            results[key][subkey][subsubkey] = dict(subvalue)
+        # Convert defaultdict to regular dict (the schema is fixed, so list the counters explicitly),
+        # sorted once by key so the report can iterate them in order
+        for counters in (results['os'], results['bios']):
+            for key, counts in counters.items():
+                counters[key] = dict(sorted(counts.items()))
+        results['gpu']['names'] = dict(sorted(results['gpu']['names'].items()))
+        for section in (results['ram'], results['disk'], results['gpu']['ram'],
+                        results['network_interfaces'], results['battery'],
+                        results['cpu']['physical_cores'], results['cpu']['logical_cores'],
+                        *results['cpu']['frequency'].values()):
+            section['distribution'] = dict(sorted(section['distribution'].items()))
 
         client.close()
         return results
@@ -285,110 +295,115 @@ def analyze_static_data() -> Dict:
         return {}
 
 def print_analysis(results: Dict):
-    """Print the analysis results in a formatted way."""
-    print("\n=== Comprehensive Static Data Analysis ===")
-    print(f"Total Machines: {results.get('total_machines', 0)}")
+    """Print the analysis results in a formatted way (distributions arrive sorted by key)."""
+    # Build the whole report first and write it once instead of one print() per line
+    lines = []
+    lines.append("\n=== Comprehensive Static Data Analysis ===")
+    lines.append(f"Total Machines: {results.get('total_machines', 0)}")
     
-    print("\nMachine Types:")
+    lines.append("\nMachine Types:")
     for mtype, count in results['machine_types'].items():
-        print(f"  {mtype.capitalize()}: {count}")
+        lines.append(f"  {mtype.capitalize()}: {count}")
     
-    print("\nOS Statistics:")
-    print("  OS Types:")
-    for os, count in sorted(results['os']['types'].items()):
-        print(f"    {os}: {count}")
-    print("  OS Versions:")
-    for version, count in sorted(results['os']['versions'].items()):
-        print(f"    {version}: {count}")
-    print("  OS Releases:")
-    for release, count in sorted(results['os']['releases'].items()):
-        print(f"    {release}: {count}")
+    lines.append("\nOS Statistics:")
+    lines.append("  OS Types:")
+    for os, count in results['os']['types'].items():
+        lines.append(f"    {os}: {count}")
+    lines.append("  OS Versions:")
+    for version, count in results['os']['versions'].items():
+        lines.append(f"    {version}: {count}")
+    lines.append("  OS Releases:")
+    for release, count in results['os']['releases'].items():
+        lines.append(f"    {release}: {count}")
     
-    print("\nRAM Statistics:")
-    print(f"  Total RAM: {results['ram']['total_gb']:.2f} GB")
-    print(f"  Average RAM per Machine: {results['ram']['average_gb']:.2f} GB")
-    print("  RAM Distribution (GB):")
-    for ram, count in sorted(results['ram']['distribution'].items()):
-        print(f"    {ram} GB: {count} machines")
+    lines.append("\nRAM Statistics:")
+    lines.append(f"  Total RAM: {results['ram']['total_gb']:.2f} GB")
+    lines.append(f"  Average RAM per Machine: {results['ram']['average_gb']:.2f} GB")
+    lines.append("  RAM Distribution (GB):")
+    for ram, count in results['ram']['distribution'].items():
+        lines.append(f"    {ram} GB: {count} machines")
     
-    print("\nCPU Statistics:")
-    print("  Physical Cores:")
-    print(f"    Total: {results['cpu']['physical_cores']['total']}")
-    print(f"    Average per Machine: {results['cpu']['physical_cores']['average']:.2f}")
-    print("    Distribution:")
-    for cores, count in sorted(results['cpu']['physical_cores']['distribution'].items()):
-        print(f"      {cores} cores: {count} machines")
-    print("  Logical Cores:")
-    print(f"    Total: {results['cpu']['logical_cores']['total']}")
-    print(f"    Average per Machine: {results['cpu']['logical_cores']['average']:.2f}")
-    print("    Distribution:")
-    for cores, count in sorted(results['cpu']['logical_cores']['distribution'].items()):
-        print(f"      {cores} cores: {count} machines")
-    print("  CPU Frequency (MHz):")
-    print("    Min Frequency:")
-    print(f"      Total: {results['cpu']['frequency']['min']['total']:.2f} MHz")
-    print(f"      Average: {results['cpu']['frequency']['min']['average']:.2f} MHz")
-    print("      Distribution:")
-    for freq, count in sorted(results['cpu']['frequency']['min']['distribution'].items()):
-        print(f"        {freq} MHz: {count} machines")
-    print("    Max Frequency:")
-    print(f"      Total: {results['cpu']['frequency']['max']['total']:.2f} MHz")
-    print(f"      Average: {results['cpu']['frequency']['max']['average']:.2f} MHz")
-    print("      Distribution:")
-    for freq, count in sorted(results['cpu']['frequency']['max']['distribution'].items()):
-        print(f"        {freq} MHz: {count} machines")
-    print("    Current Frequency:")
-    print(f"      Total: {results['cpu']['frequency']['current']['total']:.2f} MHz")
-    print(f"      Average: {results['cpu']['frequency']['current']['average']:.2f} MHz")
-    print("      Distribution:")
-    for freq, count in sorted(results['cpu']['frequency']['current']['distribution'].items()):
-        print(f"        {freq} MHz: {count} machines")
+    lines.append("\nCPU Statistics:")
+    lines.append("  Physical Cores:")
+    lines.append(f"    Total: {results['cpu']['physical_cores']['total']}")
+    lines.append(f"    Average per Machine: {results['cpu']['physical_cores']['average']:.2f}")
+    lines.append("    Distribution:")
+    for cores, count in results['cpu']['physical_cores']['distribution'].items():
+        lines.append(f"      {cores} cores: {count} machines")
+    lines.append("  Logical Cores:")
+    lines.append(f"    Total: {results['cpu']['logical_cores']['total']}")
+    lines.append(f"    Average per Machine: {results['cpu']['logical_cores']['average']:.2f}")
+    lines.append("    Distribution:")
+    for cores, count in results['cpu']['logical_cores']['distribution'].items():
+        lines.append(f"      {cores} cores: {count} machines")
+    lines.append("  CPU Frequency (MHz):")
+    lines.append("    Min Frequency:")
+    lines.append(f"      Total: {results['cpu']['frequency']['min']['total']:.2f} MHz")
+    lines.append(f"      Average: {results['cpu']['frequency']['min']['average']:.2f} MHz")
+    lines.append("      Distribution:")
+    for freq, count in results['cpu']['frequency']['min']['distribution'].items():
+        lines.append(f"        {freq} MHz: {count} machines")
+    lines.append("    Max Frequency:")
+    lines.append(f"      Total: {results['cpu']['frequency']['max']['total']:.2f} MHz")
+    lines.append(f"      Average: {results['cpu']['frequency']['max']['average']:.2f} MHz")
+    lines.append("      Distribution:")
+    for freq, count in results['cpu']['frequency']['max']['distribution'].items():
+        lines.append(f"        {freq} MHz: {count} machines")
+    lines.append("    Current Frequency:")
+    lines.append(f"      Total: {results['cpu']['frequency']['current']['total']:.2f} MHz")
+    lines.append(f"      Average: {results['cpu']['frequency']['current']['average']:.2f} MHz")
+    lines.append("      Distribution:")
+    for freq, count in results['cpu']['frequency']['current']['distribution'].items():
+        lines.append(f"        {freq} MHz: {count} machines")
     
-    print("\nDisk Statistics:")
-    print(f"  Total Disk Capacity: {results['disk']['total_gb']:.2f} GB")
-    print(f"  Average Disk Capacity per Machine: {results['disk']['average_gb']:.2f} GB")
-    print("  Disk Capacity Distribution (GB):")
-    for disk, count in sorted(results['disk']['distribution'].items()):
-        print(f"    {disk} GB: {count} machines")
+    lines.append("\nDisk Statistics:")
+    lines.append(f"  Total Disk Capacity: {results['disk']['total_gb']:.2f} GB")
+    lines.append(f"  Average Disk Capacity per Machine: {results['disk']['average_gb']:.2f} GB")
+    lines.append("  Disk Capacity Distribution (GB):")
+    for disk, count in results['disk']['distribution'].items():
+        lines.append(f"    {disk} GB: {count} machines")
     
-    print("\nBIOS and Motherboard Manufacturers:")
-    print("  BIOS Manufacturer:")
-    for manu, count in sorted(results['bios']['bios_manufacturer'].items()):
-        print(f"    {manu}: {count}")
-    print("  Motherboard Manufacturer:")
-    for manu, count in sorted(results['bios']['motherboard_manufacturer'].items()):
-        print(f"    {manu}: {count}")
+    lines.append("\nBIOS and Motherboard Manufacturers:")
+    lines.append("  BIOS Manufacturer:")
+    for manu, count in results['bios']['bios_manufacturer'].items():
+        lines.append(f"    {manu}: {count}")
+    lines.append("  Motherboard Manufacturer:")
+    for manu, count in results['bios']['motherboard_manufacturer'].items():
+        lines.append(f"    {manu}: {count}")
     
-    print("\nGPU Statistics:")
-    print(f"  Machines with GPU: {results['gpu']['has_gpu']}")
-    print("  GPU Names:")
-    for name, count in sorted(results['gpu']['names'].items()):
-        print(f"    {name}: {count}")
-    print(f"  Total GPU RAM: {results['gpu']['ram']['total_gb']:.2f} GB")
-    print(f"  Average GPU RAM per GPU Machine: {results['gpu']['ram']['average_gb']:.2f} GB")
-    print("  GPU RAM Distribution (GB):")
-    for ram, count in sorted(results['gpu']['ram']['distribution'].items()):
-        print(f"    {ram} GB: {count} machines")
+    lines.append("\nGPU Statistics:")
+    lines.append(f"  Machines with GPU: {results['gpu']['has_gpu']}")
+    lines.append("  GPU Names:")
+    for name, count in results['gpu']['names'].items():
+        lines.append(f"    {name}: {count}")
+    lines.append(f"  Total GPU RAM: {results['gpu']['ram']['total_gb']:.2f} GB")
+    lines.append(f"  Average GPU RAM per GPU Machine: {results['gpu']['ram']['average_gb']:.2f} GB")
+    lines.append("  GPU RAM Distribution (GB):")
+    for ram, count in results['gpu']['ram']['distribution'].items():
+        lines.append(f"    {ram} GB: {count} machines")
     
-    print("\nNetwork Interfaces Statistics:")
-    print(f"  Total Interfaces: {results['network_interfaces']['total_count']}")
-    print(f"  Total Speed: {results['network_interfaces']['total_speed_mbps']:.2f} Mbps")
-    print(f"  Average Speed per Machine: {results['network_interfaces']['average_speed_mbps']:.2f} Mbps")
-    print("  Interface Speed Distribution (Mbps):")
-    for speed, count in sorted(results['network_interfaces']['distribution'].items()):
-        print(f"    {speed} Mbps: {count} interfaces")
+    lines.append("\nNetwork Interfaces Statistics:")
+    lines.append(f"  Total Interfaces: {results['network_interfaces']['total_count']}")
+    lines.append(f"  Total Speed: {results['network_interfaces']['total_speed_mbps']:.2f} Mbps")
+    lines.append(f"  Average Speed per Machine: {results['network_interfaces']['average_speed_mbps']:.2f} Mbps")
+    lines.append("  Interface Speed Distribution (Mbps):")
+    for speed, count in results['network_interfaces']['distribution'].items():
+        lines.append(f"    {speed} Mbps: {count} interfaces")
     
-    print("\nBattery Statistics:")
-    print(f"  Machines with Battery: {results['battery']['has_battery']}")
-    print("  Battery Distribution:")
-    for status, count in sorted(results['battery']['distribution'].items()):
-        print(f"    {status}: {count}")
+    lines.append("\nBattery Statistics:")
+    lines.append(f"  Machines with Battery: {results['battery']['has_battery']}")
+    lines.append("  Battery Distribution:")
+    for status, count in results['battery']['distribution'].items():
+        lines.append(f"    {status}: {count}")
     
-    print("====================================\n")
+    lines.append("====================================\n")
+    sys.stdout.write('\n'.join(lines) + '\n')
 
 def main():
     """Main function to run the analysis."""
     try:
+        if not pymongo.has_c():
+            logging.warning("pymongo C extensions are not available; BSON decoding falls back to pure Python and will be slow")
         results = analyze_static_data()
         if results:
             print_analysis(results)
@@ -3,15 +3,15 @@
 """
 Script to analyze variable data from machine_monitoring database.
 Identifies days with most/least machines powered on and calculates min/max/avg for variable metrics.
+Run with --migrate to backfill the numeric traffic/uptime fields on documents stored before they existed.
 """
 
-import re
 from pymongo import MongoClient
 import logging
 from typing import Dict
-from collections import defaultdict
 from datetime import datetime
 import traceback
+import sys
 
 # Configuration du logging
 logging.basicConfig(
@@ -30,38 +30,126 @@ DATABASE_NAME = 'machine_monitoring'
 VARIABLE_COLLECTION = 'variable_data'
 MACHINE_IDS_COLLECTION = 'machine_ids'
 
-def parse_network_traffic(traffic_str: str) -> float:
-    """Convert network traffic string (e.g., '1.23 MB') to MB as float."""
-    try:
-        if not traffic_str or traffic_str == 'Non disponible':
-            return 0.0
-        match = re.match(r'(\d+\.?\d*)\s*(MB|GB|KB)', traffic_str, re.IGNORECASE)
-        if not match:
-            logging.warning(f"Invalid traffic format: {traffic_str}")
-            return 0.0
-        value, unit = float(match.group(1)), match.group(2).upper()
-        if unit == 'KB':
-            return value / 1024.0
-        elif unit == 'GB':
-            return value * 1024.0
-        return value
-    except Exception as e:
-        logging.error(f"Error parsing network traffic '{traffic_str}': {e}\n{traceback.format_exc()}")
-        return 0.0
+def string_or_null(path: str) -> Dict:
+    """Expression passing a field through only if it is a string ($regexFind rejects other types)."""
+    return {'$cond': [{'$eq': [{'$type': path}, 'string']}, path, None]}
+
+def traffic_to_mb(path: str) -> Dict:
+    """Pipeline equivalent of parse_network_traffic: '1.23 MB' -> 1.23, 0 when unparseable."""
+    return {'$let': {
+        'vars': {'m': {'$regexFind': {'input': string_or_null(path), 'regex': r'^(\d+\.?\d*)\s*(MB|GB|KB)', 'options': 'i'}}},
+        'in': {'$cond': [
+            {'$eq': ['$$m', None]},
+            0.0,
+            {'$let': {
+                'vars': {
+                    'value': {'$toDouble': {'$arrayElemAt': ['$$m.captures', 0]}},
+                    'unit': {'$toUpper': {'$arrayElemAt': ['$$m.captures', 1]}}
+                },
+                'in': {'$switch': {
+                    'branches': [
+                        {'case': {'$eq': ['$$unit', 'KB']}, 'then': {'$divide': ['$$value', 1024.0]}},
+                        {'case': {'$eq': ['$$unit', 'GB']}, 'then': {'$multiply': ['$$value', 1024.0]}}
+                    ],
+                    'default': '$$value'
+                }}
+            }}
+        ]}
+    }}
+
+def uptime_to_seconds(path: str) -> Dict:
+    """Uptime string ('1 day, 2:30:00' or '4:32:15.568523') to whole seconds, 0 when unparseable."""
+    return {'$let': {
+        'vars': {'m': {'$regexFind': {'input': string_or_null(path), 'regex': r'^(?:(\d+) days?, )?(\d+):(\d+):(\d+)'}}},
+        'in': {'$cond': [
+            {'$eq': ['$$m', None]},
+            0,
+            {'$add': [
+                {'$multiply': [{'$toInt': {'$ifNull': [{'$arrayElemAt': ['$$m.captures', 0]}, '0']}}, 86400]},
+                {'$multiply': [{'$toInt': {'$arrayElemAt': ['$$m.captures', 1]}}, 3600]},
+                {'$multiply': [{'$toInt': {'$arrayElemAt': ['$$m.captures', 2]}}, 60]},
+                {'$toInt': {'$arrayElemAt': ['$$m.captures', 3]}}
+            ]}
+        ]}
+    }}
+
+def numeric_or(path: str, fallback: Dict) -> Dict:
+    """Expression using a numeric field as is, falling back to parsing the legacy string field."""
+    return {'$cond': [{'$in': [{'$type': path}, ['double', 'int', 'long', 'decimal']]}, path, fallback]}
+
+# Numeric companions of the string fields, written at ingest by server.py / process_zipped_data.py
+NUMERIC_FIELDS = {
+    'reseau.octets_envoyes_mb': traffic_to_mb('$reseau.octets_envoyes'),
+    'reseau.octets_recus_mb': traffic_to_mb('$reseau.octets_recus'),
+    'uptime_seconds': uptime_to_seconds('$uptime')
+}
 
-def analyze_variable_data() -> Dict:
+# Result metric -> field computed by the pipeline
+METRIC_FIELDS = {
+    'cpu_usage_percent': 'cpu',
+    'memory_used_percent': 'mem_used',
+    'memory_free_percent': 'mem_free',
+    'disk_used_percent': 'disk_used',
+    'disk_free_percent': 'disk_free',
+    'network_sent_mb': 'sent',
+    'network_received_mb': 'received',
+    'process_count': 'processes',
+    'uptime_seconds': 'uptime'
+}
+
+VARIABLE_PIPELINE = [
+    {'$facet': {
+        'days': [
+            {'$match': {'timestamp': {'$type': 'date'}, 'machine_id': {'$nin': [None, '']}}},
+            # Distinct (day, machine) pairs, then a count per day: no per-day id sets
+            {'$group': {
+                '_id': {
+                    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp'}},
+                    'machine_id': '$machine_id'
+                }
+            }},
+            {'$group': {'_id': '$_id.day', 'machines': {'$sum': 1}}},
+            {'$sort': {'_id': 1}}
+        ],
+        'metrics': [
+            {'$project': {
+                '_id': 0,
+                'cpu': {'$ifNull': ['$cpu.global_utilise', 0.0]},
+                'mem_used': {'$ifNull': ['$memoire.ram.pourcentage_utilise', 0.0]},
+                'disk_used': {'$ifNull': ['$disque.pourcentage_utilise', 0.0]},
+                'sent': numeric_or('$reseau.octets_envoyes_mb', NUMERIC_FIELDS['reseau.octets_envoyes_mb']),
+                'received': numeric_or('$reseau.octets_recus_mb', NUMERIC_FIELDS['reseau.octets_recus_mb']),
+                'processes': {'$ifNull': ['$nombre_processus', 0]},
+                'uptime': numeric_or('$uptime_seconds', NUMERIC_FIELDS['uptime_seconds']),
+                'connected': {'$cond': ['$connexion_internet', 1, 0]},
+                'breach_cpu': {'$cond': ['$seuil_atteint.cpu', 1, 0]},
+                'breach_memory': {'$cond': ['$seuil_atteint.memory', 1, 0]},
+                'breach_disk': {'$cond': ['$seuil_atteint.disk', 1, 0]}
+            }},
+            {'$addFields': {
+                'mem_free': {'$cond': [{'$lte': ['$mem_used', 100.0]}, {'$subtract': [100.0, '$mem_used']}, 0.0]},
+                'disk_free': {'$cond': [{'$lte': ['$disk_used', 100.0]}, {'$subtract': [100.0, '$disk_used']}, 0.0]}
+            }},
+            {'$group': {
+                '_id': None,
+                'n': {'$sum': 1},
+                **{f'{field}_{op}': {f'${op}': f'${field}'} for field in METRIC_FIELDS.values() for op in ('min', 'max', 'sum')},
+                **{key: {'$sum': f'${key}'} for key in ('connected', 'breach_cpu', 'breach_memory', 'breach_disk')}
+            }}
+        ]
+    }}
+]
+
+def analyze_variable_data(db) -> Dict:
     """Analyze variable data from MongoDB and return statistics."""
     try:
-        # Connect to MongoDB
-        client = MongoClient(MONGO_HOST, MONGO_PORT)
-        db = client[DATABASE_NAME]
         variable_collection = db[VARIABLE_COLLECTION]
         machine_ids_collection = db[MACHINE_IDS_COLLECTION]
 
         # Initialize result dictionary
         results = {
             'machine_activity': {
-                'by_day': defaultdict(set),
+                'by_day': {},
                 'most_active_day': {'day': '', 'count': 0},
                 'least_active_day': {'day': '', 'count': float('inf')}
             },
@@ -80,149 +168,37 @@ def analyze_variable_data() -> Dict:
             }
         }
 
-        # Fetch variable data
-        documents = variable_collection.find({}, {
-            'machine_id': 1,
-            'timestamp': 1,
-            'cpu.global_utilise': 1,
-            'memoire.ram.pourcentage_utilise': 1,
-            'disque.pourcentage_utilise': 1,
-            'reseau.octets_envoyes': 1,
-            'reseau.octets_recus': 1,
-            'nombre_processus': 1,
-            'uptime': 1,
-            'connexion_internet': 1,
-            'seuil_atteint': 1,
-            '_id': 0
-        })
+        # One server-side pass: active machines per day, and min/max/sum of every metric
+        facets = next(variable_collection.aggregate(VARIABLE_PIPELINE, allowDiskUse=True))
 
         # Process machine activity by day
-        for doc in documents:
-            timestamp = doc.get('timestamp')
-            machine_id = doc.get('machine_id')
-            if timestamp and machine_id:
-                day = timestamp.strftime('%Y-%m-%d')
-                results['machine_activity']['by_day'][day].add(machine_id)
+        for row in facets['days']:
+            results['machine_activity']['by_day'][row['_id']] = row['machines']
 
         # Calculate most and least active days
-        for day, machines in results['machine_activity']['by_day'].items():
-            count = len(machines)
+        for day, count in results['machine_activity']['by_day'].items():
             if count > results['machine_activity']['most_active_day']['count']:
                 results['machine_activity']['most_active_day'] = {'day': day, 'count': count}
             if count < results['machine_activity']['least_active_day']['count']:
                 results['machine_activity']['least_active_day'] = {'day': day, 'count': count}
 
-        # Reset cursor to process metrics
-        documents = variable_collection.find({}, {
-            'cpu.global_utilise': 1,
-            'memoire.ram.pourcentage_utilise': 1,
-            'disque.pourcentage_utilise': 1,
-            'reseau.octets_envoyes': 1,
-            'reseau.octets_recus': 1,
-            'nombre_processus': 1,
-            'uptime': 1,
-            'connexion_internet': 1,
-            'seuil_atteint': 1,
-            '_id': 0
-        })
-
-        # Initialize accumulators
-        cpu_sum = 0
-        mem_sum = 0
-        disk_sum = 0
-        sent_sum = 0
-        received_sum = 0
-        process_sum = 0
-        uptime_sum = 0
-        total_docs = 0
-
-        for doc in documents:
-            total_docs += 1
-
-            # CPU Usage
-            cpu = doc.get('cpu', {}).get('global_utilise', 0.0) or 0.0
-            results['metrics']['cpu_usage_percent']['min'] = min(results['metrics']['cpu_usage_percent']['min'], cpu)
-            results['metrics']['cpu_usage_percent']['max'] = max(results['metrics']['cpu_usage_percent']['max'], cpu)
-            cpu_sum += cpu
-
-            # Memory Usage
-            mem_used = doc.get('memoire', {}).get('ram', {}).get('pourcentage_utilise', 0.0) or 0.0
-            mem_free = 100.0 - mem_used if mem_used <= 100.0 else 0.0
-            results['metrics']['memory_used_percent']['min'] = min(results['metrics']['memory_used_percent']['min'], mem_used)
-            results['metrics']['memory_used_percent']['max'] = max(results['metrics']['memory_used_percent']['max'], mem_used)
-            results['metrics']['memory_free_percent']['min'] = min(results['metrics']['memory_free_percent']['min'], mem_free)
-            results['metrics']['memory_free_percent']['max'] = max(results['metrics']['memory_free_percent']['max'], mem_free)
-            mem_sum += mem_used
-
-            # Disk Usage
-            disk_used = doc.get('disque', {}).get('pourcentage_utilise', 0.0) or 0.0
-            disk_free = 100.0 - disk_used if disk_used <= 100.0 else 0.0
-            results['metrics']['disk_used_percent']['min'] = min(results['metrics']['disk_used_percent']['min'], disk_used)
-            results['metrics']['disk_used_percent']['max'] = max(results['metrics']['disk_used_percent']['max'], disk_used)
-            results['metrics']['disk_free_percent']['min'] = min(results['metrics']['disk_free_percent']['min'], disk_free)
-            results['metrics']['disk_free_percent']['max'] = max(results['metrics']['disk_free_percent']['max'], disk_free)
-            disk_sum += disk_used
-
-            # Network Traffic
-            sent = parse_network_traffic(doc.get('reseau', {}).get('octets_envoyes', '0 MB'))
-            received = parse_network_traffic(doc.get('reseau', {}).get('octets_recus', '0 MB'))
-            results['metrics']['network_sent_mb']['min'] = min(results['metrics']['network_sent_mb']['min'], sent)
-            results['metrics']['network_sent_mb']['max'] = max(results['metrics']['network_sent_mb']['max'], sent)
-            results['metrics']['network_received_mb']['min'] = min(results['metrics']['network_received_mb']['min'], received)
-            results['metrics']['network_received_mb']['max'] = max(results['metrics']['network_received_mb']['max'], received)
-            sent_sum += sent
-            received_sum += received
-
-            # Process Count
-            processes = doc.get('nombre_processus', 0) or 0
-            results['metrics']['process_count']['min'] = min(results['metrics']['process_count']['min'], processes)
-            results['metrics']['process_count']['max'] = max(results['metrics']['process_count']['max'], processes)
-            process_sum += processes
-
-            # Uptime (convert to seconds)
-            uptime_str = doc.get('uptime', '0') or '0'
-            try:
-                parts = uptime_str.split(',')
-                days = int(parts[0].split()[0]) if 'day' in uptime_str else 0
-                time_parts = parts[-1].strip().split(':')
-                hours, minutes, seconds = map(int, time_parts)
-                uptime_secs = days * 86400 + hours * 3600 + minutes * 60 + seconds
-            except:
-                uptime_secs = 0
-            results['metrics']['uptime_seconds']['min'] = min(results['metrics']['uptime_seconds']['min'], uptime_secs)
-            results['metrics']['uptime_seconds']['max'] = max(results['metrics']['uptime_seconds']['max'], uptime_secs)
-            uptime_sum += uptime_secs
-
-            # Internet Connectivity
-            connected = doc.get('connexion_internet', False)
-            results['metrics']['internet_connectivity']['connected_count'] += 1 if connected else 0
-            results['metrics']['internet_connectivity']['total_count'] += 1
-
-            # Threshold Breaches
-            thresholds = doc.get('seuil_atteint', {})
-            if thresholds.get('cpu', False):
-                results['metrics']['threshold_breaches']['cpu'] += 1
-            if thresholds.get('memory', False):
-                results['metrics']['threshold_breaches']['memory'] += 1
-            if thresholds.get('disk', False):
-                results['metrics']['threshold_breaches']['disk'] += 1
-            results['metrics']['threshold_breaches']['total'] += sum(1 for k, v in thresholds.items() if v)
+        totals = facets['metrics'][0] if facets['metrics'] else {'n': 0}
+        total_docs = totals['n']
 
         # Calculate averages
         if total_docs > 0:
-            results['metrics']['cpu_usage_percent']['avg'] = cpu_sum / total_docs
-            results['metrics']['memory_used_percent']['avg'] = mem_sum / total_docs
+            for metric, field in METRIC_FIELDS.items():
+                results['metrics'][metric]['min'] = totals[f'{field}_min']
+                results['metrics'][metric]['max'] = max(0.0, totals[f'{field}_max'])
+                results['metrics'][metric]['avg'] = totals[f'{field}_sum'] / total_docs
             results['metrics']['memory_free_percent']['avg'] = 100.0 - results['metrics']['memory_used_percent']['avg']
-            results['metrics']['disk_used_percent']['avg'] = disk_sum / total_docs
             results['metrics']['disk_free_percent']['avg'] = 100.0 - results['metrics']['disk_used_percent']['avg']
-            results['metrics']['network_sent_mb']['avg'] = sent_sum / total_docs
-            results['metrics']['network_received_mb']['avg'] = received_sum / total_docs
-            results['metrics']['process_count']['avg'] = process_sum / total_docs
-            results['metrics']['uptime_seconds']['avg'] = uptime_sum / total_docs
-            results['metrics']['internet_connectivity']['percentage'] = (
-                results['metrics']['internet_connectivity']['connected_count'] / 
-                results['metrics']['internet_connectivity']['total_count'] * 100
-            ) if results['metrics']['internet_connectivity']['total_count'] > 0 else 0.0
+            results['metrics']['internet_connectivity']['connected_count'] = totals['connected']
+            results['metrics']['internet_connectivity']['total_count'] = total_docs
+            results['metrics']['internet_connectivity']['percentage'] = totals['connected'] / total_docs * 100
+            for key in ('cpu', 'memory', 'disk'):
+                results['metrics']['threshold_breaches'][key] = totals[f'breach_{key}']
+            results['metrics']['threshold_breaches']['total'] = sum(totals[f'breach_{key}'] for key in ('cpu', 'memory', 'disk'))
 
         # Set counts for metrics
         for metric in ['cpu_usage_percent', 'memory_used_percent', 'memory_free_percent', 
@@ -238,8 +214,6 @@ def analyze_variable_data() -> Dict:
                 results['metrics'][metric]['min'] = 0.0
                 results['metrics'][metric]['max'] = 0.0
                 results['metrics'][metric]['avg'] = 0.0
-
-        client.close()
         return results
 
     except Exception as e:
@@ -314,16 +288,36 @@ def print_analysis(results: Dict):
     
     print("=============================\n")
 
+def migrate_numeric_fields(db):
+    """Backfill the numeric traffic/uptime fields server-side on documents that lack them (MongoDB 4.2+)."""
+    try:
+        collection = db[VARIABLE_COLLECTION]
+        result = collection.update_many(
+            {'uptime_seconds': {'$exists': False}},
+            [{'$set': NUMERIC_FIELDS}]
+        )
+        logging.info(f"Numeric fields added to {result.modified_count} variable documents")
+    except Exception as e:
+        logging.error(f"Error migrating numeric fields: {e}\n{traceback.format_exc()}")
+
 def main():
     """Main function to run the analysis."""
+    # One pooled client shared by every query of the run, opened only when the script runs
+    mongo_client = MongoClient(MONGO_HOST, MONGO_PORT, maxPoolSize=16)
     try:
-        results = analyze_variable_data()
+        db = mongo_client[DATABASE_NAME]
+        if '--migrate' in sys.argv[1:]:
+            migrate_numeric_fields(db)
+            return
+        results = analyze_variable_data(db)
         if results:
             print_analysis(results)
         else:
             logging.error("No results returned from analysis")
     except Exception as e:
         logging.error(f"Error in main: {e}\n{traceback.format_exc()}")
+    finally:
+        mongo_client.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
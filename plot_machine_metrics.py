@@ -2,27 +2,23 @@
 # -*- coding: utf-8 -*-
 """
 Script to plot time-series metrics for a machine with RAM >= 16GB and >= 8 logical cores
-on the most active day. Generates plots for CPU, memory, disk, network, and processes.
+on the most active day. Generates a dashboard of CPU, memory, disk, network, process and uptime plots.
 """
 
 import re
 from pymongo import MongoClient
 import logging
 from typing import Dict, List
+import matplotlib
+matplotlib.use('Agg')  # Files only, no GUI backend negotiation
 import matplotlib.pyplot as plt
+plt.rcParams['agg.path.chunksize'] = 10000
 from datetime import datetime, timedelta
 import traceback
 import os
-
-# Configuration du logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('plot_machine_metrics.log'),
-        logging.StreamHandler()
-    ]
-)
+from functools import lru_cache
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
 
 # MongoDB Configuration
 MONGO_HOST = 'localhost'
@@ -34,12 +30,27 @@ VARIABLE_COLLECTION = 'variable_data'
 # Most active day from analyze_variable_data.py
 MOST_ACTIVE_DAY = '2025-06-23'  # Updated based on user input
 
+# True: six standalone PNGs rendered in parallel; False: one dashboard PNG
+SEPARATE_PLOTS = False
+
+# Series longer than this are min/max decimated into this many buckets before plotting
+MAX_PLOT_POINTS = 2000
+
+# Columns of the flattened rows returned by fetch_machine_data
+ROW_FIELDS = itemgetter('timestamp', 'cpu', 'mem', 'disk', 'sent', 'recv', 'procs', 'uptime')
+
+MEMORY_RE = re.compile(r'(\d+\.?\d*)\s*(GB|MB|TB)', re.IGNORECASE)
+TRAFFIC_RE = re.compile(r'(\d+\.?\d*)\s*(MB|GB|KB)', re.IGNORECASE)
+# Agent format is '<value> <unit>': MB multipliers for the suffixes it emits
+TRAFFIC_SUFFIXES = {' KB': 1 / 1024.0, ' MB': 1.0, ' GB': 1024.0}
+
+@lru_cache(maxsize=4096)
 def parse_memory_size(memory_str: str) -> float:
     """Convert memory string (e.g., '7.68 GB') to GB as float."""
     try:
         if not memory_str or memory_str == 'Non disponible':
             return 0.0
-        match = re.match(r'(\d+\.?\d*)\s*(GB|MB|TB)', memory_str, re.IGNORECASE)
+        match = MEMORY_RE.match(memory_str)
         if not match:
             logging.warning(f"Invalid memory format: {memory_str}")
             return 0.0
@@ -53,12 +64,19 @@ def parse_memory_size(memory_str: str) -> float:
         logging.error(f"Error parsing memory size '{memory_str}': {e}\n{traceback.format_exc()}")
         return 0.0
 
+@lru_cache(maxsize=4096)
 def parse_network_traffic(traffic_str: str) -> float:
     """Convert network traffic string (e.g., '1.23 MB') to MB as float."""
     try:
         if not traffic_str or traffic_str == 'Non disponible':
             return 0.0
-        match = re.match(r'(\d+\.?\d*)\s*(MB|GB|KB)', traffic_str, re.IGNORECASE)
+        factor = TRAFFIC_SUFFIXES.get(traffic_str[-3:])
+        if factor is not None:
+            try:
+                return float(traffic_str[:-3]) * factor
+            except ValueError:
+                pass
+        match = TRAFFIC_RE.match(traffic_str)
         if not match:
             logging.warning(f"Invalid traffic format: {traffic_str}")
             return 0.0
@@ -72,62 +90,82 @@ def parse_network_traffic(traffic_str: str) -> float:
         logging.error(f"Error parsing network traffic '{traffic_str}': {e}\n{traceback.format_exc()}")
         return 0.0
 
+@lru_cache(maxsize=4096)
 def parse_uptime(uptime_str: str) -> float:
     """Convert uptime string (e.g., '1 day, 2:30:00' or '4:32:15.568523') to seconds."""
     try:
         if not uptime_str or uptime_str == 'Non disponible':
             return 0.0
-        # Split on comma for cases with days
-        parts = uptime_str.split(',')
+        # Fixed timedelta shape '[N day(s), ]H:MM:SS[.ffffff]': slice by position, no split lists
         days = 0
-        time_str = parts[-1].strip()  # Get the time part (last element)
-        
-        # Check for days
-        if len(parts) > 1 and 'day' in parts[0].lower():
-            days = int(parts[0].split()[0])
-        
-        # Split time part into hours, minutes, seconds (ignoring microseconds)
-        time_parts = time_str.split(':')
-        if len(time_parts) != 3:
+        start = 0
+        comma = uptime_str.find(',')
+        if comma != -1:
+            start = uptime_str.rfind(',') + 1
+            if 'day' in uptime_str[:comma].lower():
+                head = uptime_str[:comma].lstrip()
+                space = head.find(' ')
+                days = int(head[:space] if space != -1 else head)
+
+        first = uptime_str.find(':', start)
+        second = uptime_str.find(':', first + 1) if first != -1 else -1
+        if second == -1 or uptime_str.find(':', second + 1) != -1:
             logging.warning(f"Invalid uptime format: {uptime_str}")
             return 0.0
-        
-        hours, minutes, seconds_str = time_parts
-        # Remove microseconds (if present) by taking only the integer part of seconds
-        seconds = int(float(seconds_str.split('.')[0]))
-        
-        return days * 86400 + int(hours) * 3600 + int(minutes) * 60 + seconds
+
+        # Ignore microseconds (if present) by stopping the seconds slice at the dot
+        dot = uptime_str.find('.', second)
+        seconds = int(uptime_str[second + 1:dot] if dot != -1 else uptime_str[second + 1:])
+
+        return days * 86400 + int(uptime_str[start:first]) * 3600 + int(uptime_str[first + 1:second]) * 60 + seconds
     except Exception as e:
         logging.error(f"Error parsing uptime '{uptime_str}': {e}\n{traceback.format_exc()}")
         return 0.0
 
-def select_machine() -> str:
+def numeric_or_parse(value, parser) -> float:
+    """Return a value stored numerically at ingest as is, parsing legacy string values."""
+    return parser(value) if isinstance(value, str) else value
+
+def downsample(xs, ys, buckets: int = MAX_PLOT_POINTS):
+    """Min/max decimation: keep each bucket's extremes in time order, so peaks survive."""
+    n = len(ys)
+    if n <= buckets:
+        return xs, ys
+    out_x, out_y = [], []
+    for b in range(buckets):
+        lo, hi = b * n // buckets, (b + 1) * n // buckets
+        i_min = min(range(lo, hi), key=ys.__getitem__)
+        i_max = max(range(lo, hi), key=ys.__getitem__)
+        for i in sorted({i_min, i_max}):
+            out_x.append(xs[i])
+            out_y.append(ys[i])
+    return out_x, out_y
+
+def select_machine(db) -> str:
     """Select a machine with RAM >= 16GB and >= 8 logical cores."""
     try:
-        client = MongoClient(MONGO_HOST, MONGO_PORT)
-        db = client[DATABASE_NAME]
         static_collection = db[STATIC_COLLECTION]
 
-        # Fetch all machines to inspect RAM and cores
-        machines = static_collection.find(
-            {},
-            {'machine_id': 1, 'memoire.ram.total': 1, 'cpu.coeurs_logiques': 1, '_id': 0}
+        # RAM is stored in GB at ingest: indexed lookup of the first qualifying machine
+        machine = static_collection.find_one(
+            {'cpu.coeurs_logiques': {'$gte': 8}, 'memoire.ram.total_gb': {'$gte': 16}},
+            {'machine_id': 1, '_id': 0}
         )
+        selected_machine = machine['machine_id'] if machine else None
 
-        qualifying_machines = []
-        for machine in machines:
-            ram_str = machine.get('memoire', {}).get('ram', {}).get('total', '0 GB')
-            ram = parse_memory_size(ram_str)
-            cores = machine.get('cpu', {}).get('coeurs_logiques', 0) or 0
-            if ram >= 16 and cores >= 8:
-                qualifying_machines.append(machine['machine_id'])
-            else:
-                logging.debug(f"Machine {machine['machine_id']}: RAM {ram} GB, Cores {cores} - does not qualify")
+        if not selected_machine:
+            # Documents stored before total_gb existed still need the RAM string parsed
+            machines = static_collection.find(
+                {'memoire.ram.total_gb': {'$exists': False}, 'cpu.coeurs_logiques': {'$gte': 8}},
+                {'machine_id': 1, 'memoire.ram.total': 1, '_id': 0}
+            )
+            for machine in machines:
+                ram_str = machine.get('memoire', {}).get('ram', {}).get('total', '0 GB')
+                if parse_memory_size(ram_str) >= 16:
+                    selected_machine = machine['machine_id']
+                    break
 
-        client.close()
-
-        if qualifying_machines:
-            selected_machine = qualifying_machines[0]  # Select first qualifying machine
+        if selected_machine:
             logging.info(f"Selected machine {selected_machine} with RAM >= 16GB and >= 8 logical cores")
             return selected_machine
         else:
@@ -137,44 +175,64 @@ def select_machine() -> str:
         logging.error(f"Error selecting machine: {e}\n{traceback.format_exc()}")
         return None
 
-def fetch_machine_data(machine_id: str, day: str) -> List[Dict]:
+def fetch_machine_data(db, machine_id: str, day: str) -> List[Dict]:
     """Fetch variable data for the specified machine and day."""
     try:
-        client = MongoClient(MONGO_HOST, MONGO_PORT)
-        db = client[DATABASE_NAME]
         variable_collection = db[VARIABLE_COLLECTION]
 
         start_date = datetime.strptime(day, '%Y-%m-%d')
         end_date = start_date + timedelta(days=1)
 
-        data = variable_collection.find(
-            {
+        # Flat rows with defaults filled server-side: every key is present for ROW_FIELDS
+        data = variable_collection.aggregate([
+            {'$match': {
                 'machine_id': machine_id,
                 'timestamp': {
                     '$gte': start_date,
                     '$lt': end_date
                 }
-            },
-            {
+            }},
+            {'$sort': {'timestamp': 1}},
+            {'$project': {
+                '_id': 0,
                 'timestamp': 1,
-                'cpu.global_utilise': 1,
-                'memoire.ram.pourcentage_utilise': 1,
-                'disque.pourcentage_utilise': 1,
-                'reseau.octets_envoyes': 1,
-                'reseau.octets_recus': 1,
-                'nombre_processus': 1,
-                'uptime': 1,
-                '_id': 0
-            }
-        ).sort('timestamp', 1)
+                'cpu': {'$ifNull': ['$cpu.global_utilise', 0.0]},
+                'mem': {'$ifNull': ['$memoire.ram.pourcentage_utilise', 0.0]},
+                'disk': {'$ifNull': ['$disque.pourcentage_utilise', 0.0]},
+                # Numeric fields from ingest, legacy strings otherwise
+                'sent': {'$ifNull': ['$reseau.octets_envoyes_mb', {'$ifNull': ['$reseau.octets_envoyes', 0.0]}]},
+                'recv': {'$ifNull': ['$reseau.octets_recus_mb', {'$ifNull': ['$reseau.octets_recus', 0.0]}]},
+                'procs': {'$ifNull': ['$nombre_processus', 0]},
+                'uptime': {'$ifNull': ['$uptime_seconds', {'$ifNull': ['$uptime', 0]}]}
+            }}
+        ])
 
         data_list = list(data)
-        client.close()
         return data_list
     except Exception as e:
         logging.error(f"Error fetching machine data: {e}\n{traceback.format_exc()}")
         return []
 
+def draw_panel(ax, title: str, ylabel: str, series: List):
+    """Draw one metric panel from (xs, ys, label, color, linestyle) series."""
+    for xs, ys, label, color, linestyle in series:
+        ax.plot(xs, ys, label=label, color=color, linewidth=2, linestyle=linestyle)
+    ax.set_title(title, fontsize=14)
+    ax.set_xlabel('Time', fontsize=12)
+    ax.set_ylabel(ylabel, fontsize=12)
+    ax.grid(True)
+    ax.legend()
+    ax.tick_params(axis='x', labelrotation=45)
+
+def render_png(spec):
+    """Render one standalone metric plot; runs in a worker process when SEPARATE_PLOTS is set."""
+    path, title, ylabel, series = spec
+    fig, ax = plt.subplots(figsize=(12, 6))
+    draw_panel(ax, title, ylabel, series)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
 def plot_metrics(data: List[Dict], machine_id: str, day: str):
     """Plot time-series metrics for the specified machine and day."""
     try:
@@ -182,100 +240,49 @@ def plot_metrics(data: List[Dict], machine_id: str, day: str):
             logging.error("No data to plot")
             return
 
-        timestamps = [doc['timestamp'] for doc in data]
-        cpu_usage = [doc.get('cpu', {}).get('global_utilise', 0.0) or 0.0 for doc in data]
-        mem_used = [doc.get('memoire', {}).get('ram', {}).get('pourcentage_utilise', 0.0) or 0.0 for doc in data]
+        timestamps, cpu_usage, mem_used, disk_used, net_sent, net_received, processes, uptime = zip(*map(ROW_FIELDS, data))
         mem_free = [100.0 - m if m <= 100.0 else 0.0 for m in mem_used]
-        disk_used = [doc.get('disque', {}).get('pourcentage_utilise', 0.0) or 0.0 for doc in data]
         disk_free = [100.0 - d if d <= 100.0 else 0.0 for d in disk_used]
-        net_sent = [parse_network_traffic(doc.get('reseau', {}).get('octets_envoyes', '0 MB')) for doc in data]
-        net_received = [parse_network_traffic(doc.get('reseau', {}).get('octets_recus', '0 MB')) for doc in data]
-        processes = [doc.get('nombre_processus', 0) or 0 for doc in data]
-        uptime = [parse_uptime(doc.get('uptime', '0')) for doc in data]
+        net_sent = [numeric_or_parse(v, parse_network_traffic) for v in net_sent]
+        net_received = [numeric_or_parse(v, parse_network_traffic) for v in net_received]
+        uptime = [numeric_or_parse(v, parse_uptime) for v in uptime]
 
         # Create output directory
         os.makedirs('plots', exist_ok=True)
 
-        # Plot 1: CPU Usage
-        plt.figure(figsize=(12, 6))
-        plt.plot(timestamps, cpu_usage, label='CPU Usage (%)', color='#4CAF50', linewidth=2)
-        plt.title(f'CPU Usage for Machine {machine_id} on {day}', fontsize=14)
-        plt.xlabel('Time', fontsize=12)
-        plt.ylabel('Usage (%)', fontsize=12)
-        plt.grid(True)
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(f'plots/cpu_usage_{machine_id}_{day}.png')
-        plt.close()
-
-        # Plot 2: Memory Usage
-        plt.figure(figsize=(12, 6))
-        plt.plot(timestamps, mem_used, label='Memory Used (%)', color='#2196F3', linewidth=2)
-        plt.plot(timestamps, mem_free, label='Memory Free (%)', color='#FF9800', linewidth=2, linestyle='--')
-        plt.title(f'Memory Usage for Machine {machine_id} on {day}', fontsize=14)
-        plt.xlabel('Time', fontsize=12)
-        plt.ylabel('Percentage (%)', fontsize=12)
-        plt.grid(True)
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(f'plots/memory_usage_{machine_id}_{day}.png')
-        plt.close()
-
-        # Plot 3: Disk Usage
-        plt.figure(figsize=(12, 6))
-        plt.plot(timestamps, disk_used, label='Disk Used (%)', color='#9C27B0', linewidth=2)
-        plt.plot(timestamps, disk_free, label='Disk Free (%)', color='#FF5722', linewidth=2, linestyle='--')
-        plt.title(f'Disk Usage for Machine {machine_id} on {day}', fontsize=14)
-        plt.xlabel('Time', fontsize=12)
-        plt.ylabel('Percentage (%)', fontsize=12)
-        plt.grid(True)
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(f'plots/disk_usage_{machine_id}_{day}.png')
-        plt.close()
-
-        # Plot 4: Network Traffic
-        plt.figure(figsize=(12, 6))
-        plt.plot(timestamps, net_sent, label='Network Sent (MB)', color='#009688', linewidth=2)
-        plt.plot(timestamps, net_received, label='Network Received (MB)', color='#F44336', linewidth=2)
-        plt.title(f'Network Traffic for Machine {machine_id} on {day}', fontsize=14)
-        plt.xlabel('Time', fontsize=12)
-        plt.ylabel('Traffic (MB)', fontsize=12)
-        plt.grid(True)
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(f'plots/network_traffic_{machine_id}_{day}.png')
-        plt.close()
-
-        # Plot 5: Process Count
-        plt.figure(figsize=(12, 6))
-        plt.plot(timestamps, processes, label='Process Count', color='#607D8B', linewidth=2)
-        plt.title(f'Process Count for Machine {machine_id} on {day}', fontsize=14)
-        plt.xlabel('Time', fontsize=12)
-        plt.ylabel('Number of Processes', fontsize=12)
-        plt.grid(True)
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(f'plots/process_count_{machine_id}_{day}.png')
-        plt.close()
-
-        # Plot 6: Uptime
-        plt.figure(figsize=(12, 6))
-        plt.plot(timestamps, uptime, label='Uptime (Seconds)', color='#795548', linewidth=2)
-        plt.title(f'Uptime for Machine {machine_id} on {day}', fontsize=14)
-        plt.xlabel('Time', fontsize=12)
-        plt.ylabel('Uptime (Seconds)', fontsize=12)
-        plt.grid(True)
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(f'plots/uptime_{machine_id}_{day}.png')
-        plt.close()
+        # (file prefix, title, y label, [(series, label, color, linestyle)]) per panel, row by row
+        panels = [
+            ('cpu_usage', 'CPU Usage', 'Usage (%)', [(cpu_usage, 'CPU Usage (%)', '#4CAF50', '-')]),
+            ('memory_usage', 'Memory Usage', 'Percentage (%)', [(mem_used, 'Memory Used (%)', '#2196F3', '-'),
+                                                                (mem_free, 'Memory Free (%)', '#FF9800', '--')]),
+            ('disk_usage', 'Disk Usage', 'Percentage (%)', [(disk_used, 'Disk Used (%)', '#9C27B0', '-'),
+                                                            (disk_free, 'Disk Free (%)', '#FF5722', '--')]),
+            ('network_traffic', 'Network Traffic', 'Traffic (MB)', [(net_sent, 'Network Sent (MB)', '#009688', '-'),
+                                                                    (net_received, 'Network Received (MB)', '#F44336', '-')]),
+            ('process_count', 'Process Count', 'Number of Processes', [(processes, 'Process Count', '#607D8B', '-')]),
+            ('uptime', 'Uptime', 'Uptime (Seconds)', [(uptime, 'Uptime (Seconds)', '#795548', '-')])
+        ]
+        panels = [
+            (prefix, title, ylabel, [(*downsample(timestamps, values), label, color, linestyle)
+                                     for values, label, color, linestyle in series])
+            for prefix, title, ylabel, series in panels
+        ]
+
+        if SEPARATE_PLOTS:
+            # One PNG per metric, encoded in parallel worker processes
+            specs = [(f'plots/{prefix}_{machine_id}_{day}.png', f'{title} for Machine {machine_id} on {day}', ylabel, series)
+                     for prefix, title, ylabel, series in panels]
+            with ProcessPoolExecutor(max_workers=len(specs)) as executor:
+                list(executor.map(render_png, specs))
+        else:
+            # One figure for all metrics: a single canvas and PNG encode instead of six
+            fig, axes = plt.subplots(3, 2, figsize=(20, 18))
+            for ax, (_, title, ylabel, series) in zip(axes.flat, panels):
+                draw_panel(ax, title, ylabel, series)
+            fig.suptitle(f'Metrics for Machine {machine_id} on {day}', fontsize=16)
+            fig.tight_layout()
+            fig.savefig(f'plots/dashboard_{machine_id}_{day}.png', dpi=100)
+            plt.close(fig)
 
         logging.info(f"Plots generated for machine {machine_id} on {day} in 'plots' directory")
 
@@ -284,13 +291,26 @@ def plot_metrics(data: List[Dict], machine_id: str, day: str):
 
 def main():
     """Main function to select machine and plot metrics."""
+    # Logging and the MongoDB client are set up here, not at import: render_png worker
+    # processes import this module and must not open log files or database connections
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('plot_machine_metrics.log'),
+            logging.StreamHandler()
+        ]
+    )
+    # One pooled client shared by every query of the run
+    mongo_client = MongoClient(MONGO_HOST, MONGO_PORT, maxPoolSize=16)
     try:
-        machine_id = select_machine()
+        db = mongo_client[DATABASE_NAME]
+        machine_id = select_machine(db)
         if not machine_id:
             logging.error("No qualifying machine found. Please check static_data.")
             return
 
-        data = fetch_machine_data(machine_id, MOST_ACTIVE_DAY)
+        data = fetch_machine_data(db, machine_id, MOST_ACTIVE_DAY)
         if not data:
             logging.error(f"No variable data found for machine {machine_id} on {MOST_ACTIVE_DAY}")
             return
@@ -298,6 +318,8 @@ def main():
         plot_metrics(data, machine_id, MOST_ACTIVE_DAY)
     except Exception as e:
         logging.error(f"Error in main: {e}\n{traceback.format_exc()}")
+    finally:
+        mongo_client.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -9,24 +9,31 @@ Skips empty or invalid JSON files with appropriate logging.
 import os
 import zipfile
 import gzip
-import json
+import zlib
+import orjson
 import hashlib
-import tempfile
-import shutil
 import logging
+import traceback
+import re
 from datetime import datetime, timedelta
 from pymongo import MongoClient
 from pydantic import BaseModel, ValidationError
-import traceback
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 
 # Configuration
 MONGO_HOST = 'localhost'
 MONGO_PORT = 27017
+MONGO_COMPRESSORS = 'zlib'  # Wire compression; put 'zstd,' first if the zstandard package is installed
 DATABASE_NAME = 'machine_monitoring'
 STATIC_COLLECTION = 'static_data'
 VARIABLE_COLLECTION = 'variable_data'
 MACHINE_IDS_COLLECTION = 'machine_ids'
 DATA_RETENTION_DAYS = 30
+LOAD_WORKERS = os.cpu_count() or 4  # Threads decompressing/parsing data files
+LOAD_AHEAD = LOAD_WORKERS * 4  # Files decompressed ahead of processing (bounds memory on large archives)
+VARIABLE_BATCH_SIZE = 1000  # Variable documents per insert_many (well below the 16 MB BSON limit)
+SAMPLE_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'  # Format of the agent's 'timestamp' field
 
 # Logging configuration
 logging.basicConfig(
@@ -38,6 +45,67 @@ logging.basicConfig(
     ]
 )
 
+# Payload fields copied into the stored documents, with the default used when a field is missing
+# (the default objects are shared, never mutated)
+STATIC_FIELDS = {
+    'os': {}, 'type_machine': 0, 'cpu': {}, 'memoire': {}, 'disque': {}, 'adresse_mac': '',
+    'resolution_ecran': '', 'gpu': {}, 'interfaces_reseau': [], 'bios_carte_mere': {},
+    'utilisateurs_connectes': [], 'partitions_disque': [], 'peripheriques_usb': [],
+    'battery_initial': {}, 'heure_demarrage_systeme': ''
+}
+VARIABLE_FIELDS = {
+    'cpu': {}, 'memoire': {}, 'disque': {}, 'gpu_utilisation': {}, 'reseau': {},
+    'connexion_internet': False, 'nombre_processus': 0, 'battery': {}, 'uptime': '', 'seuil_atteint': {}
+}
+
+MEMORY_RE = re.compile(r'(\d+\.?\d*)\s*(GB|MB|TB)', re.IGNORECASE)
+TRAFFIC_RE = re.compile(r'(\d+\.?\d*)\s*(MB|GB|KB)', re.IGNORECASE)
+UPTIME_RE = re.compile(r'(?:(\d+) days?, )?(\d+):(\d+):(\d+)')
+
+def memory_to_gb(value):
+    """Convert a memory size string ('15.8 GB') to GB, 0 when unparseable."""
+    match = MEMORY_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return 0.0
+    amount, unit = float(match.group(1)), match.group(2).upper()
+    if unit == 'MB':
+        return amount / 1024.0
+    if unit == 'TB':
+        return amount * 1024.0
+    return amount
+
+def traffic_to_mb(value):
+    """Convert a network traffic string ('1.23 MB') to MB, 0 when unparseable."""
+    match = TRAFFIC_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return 0.0
+    amount, unit = float(match.group(1)), match.group(2).upper()
+    if unit == 'KB':
+        return amount / 1024.0
+    if unit == 'GB':
+        return amount * 1024.0
+    return amount
+
+def uptime_to_seconds(value):
+    """Convert an uptime string ('1 day, 2:30:00.123') to whole seconds, 0 when unparseable."""
+    match = UPTIME_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return 0
+    days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+def sample_time(data):
+    """Collection time of a sample from its own 'timestamp' field, None when it does not parse."""
+    try:
+        return datetime.strptime(data.get('timestamp'), SAMPLE_TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+def file_number(filename):
+    """Sort key for agent data files: '10.json.gz' -> 10, so files follow collection order (-1 if not numbered)."""
+    stem = filename.split('.', 1)[0]
+    return int(stem) if stem.isdigit() else -1
+
 class StaticData(BaseModel):
     os: dict
     cpu: dict
@@ -49,17 +117,27 @@ class StaticData(BaseModel):
 class ZipDataProcessor:
     def __init__(self):
         try:
-            self.mongo_client = MongoClient(MONGO_HOST, MONGO_PORT)
+            # Bulk ingest: compressed wire protocol, acknowledged writes without waiting for the journal
+            self.mongo_client = MongoClient(
+                MONGO_HOST, MONGO_PORT,
+                compressors=MONGO_COMPRESSORS, maxPoolSize=16,
+                w=1, journal=False, retryWrites=True
+            )
             self.db = self.mongo_client[DATABASE_NAME]
             self.static_collection = self.db[STATIC_COLLECTION]
             self.variable_collection = self.db[VARIABLE_COLLECTION]
             self.machine_ids_collection = self.db[MACHINE_IDS_COLLECTION]
             self.static_collection.create_index("machine_id")
+            self.static_collection.create_index([("cpu.coeurs_logiques", 1), ("memoire.ram.total_gb", 1)])
             self.variable_collection.create_index([("machine_id", 1), ("timestamp", 1)])
             self.machine_ids_collection.create_index("machine_id", unique=True)
             logging.info("MongoDB connection established")
             # self.cleanup_old_data()
             self.machine_id = None  # Store machine_id for use across files
+            self.pending_variable_docs = []  # Variable documents waiting for flush_variable_data
+            self.pending_variable_files = []  # Source file of each pending document, for error reports
+            self.failed_variable_batches = 0
+            self.known_machine_ids = set()  # Machine IDs already confirmed in machine_ids
         except Exception as e:
             logging.error(f"Error connecting to MongoDB: {e}\n{traceback.format_exc()}")
             raise
@@ -73,74 +151,68 @@ class ZipDataProcessor:
             memoire_info = static_data.get('memoire', {})
             users = static_data.get('utilisateurs_connectes', [])
             username = users[0].get('username', '') if users else ''
-            unique_string = (
-                f"{os_info.get('hostname', '')}"
-                f"{os_info.get('nom', '')}"
-                f"{os_info.get('release', '')}"
-                f"{os_info.get('version', '')}"
-                f"{username}"
-                f"{cpu_info.get('coeurs_logiques', 0)}"
-                f"{cpu_info.get('frequence', {}).get('min', 0)}"
-                f"{cpu_info.get('frequence', {}).get('max', 0)}"
-                f"{bios_info.get('BIOS', {}).get('Fabricant', '')}"
-                f"{bios_info.get('BIOS', {}).get('Version', '')}"
-                f"{bios_info.get('Carte mère', {}).get('Fabricant', '')}"
-                f"{bios_info.get('Carte mère', {}).get('Modèle', '')}"
-                f"{memoire_info.get('ram', {}).get('total', '')}"
+            components = (
+                os_info.get('hostname', ''),
+                os_info.get('nom', ''),
+                os_info.get('release', ''),
+                os_info.get('version', ''),
+                username,
+                cpu_info.get('coeurs_logiques', 0),
+                cpu_info.get('frequence', {}).get('min', 0),
+                cpu_info.get('frequence', {}).get('max', 0),
+                bios_info.get('BIOS', {}).get('Fabricant', ''),
+                bios_info.get('BIOS', {}).get('Version', ''),
+                bios_info.get('Carte mère', {}).get('Fabricant', ''),
+                bios_info.get('Carte mère', {}).get('Modèle', ''),
+                memoire_info.get('ram', {}).get('total', '')
             )
-            return hashlib.md5(unique_string.encode('utf-8')).hexdigest()
+            # Fed piece by piece without separators: same digest as the concatenated string server.py hashes
+            digest = hashlib.md5()
+            for component in components:
+                digest.update(str(component).encode('utf-8'))
+            return digest.hexdigest()
         except Exception as e:
             logging.error(f"Error generating machine ID: {e}\n{traceback.format_exc()}")
             return None
 
-    def register_machine(self, machine_id, static_data):
+    def register_machine(self, machine_id, static_data, now=None):
         """Register a machine in the database."""
         try:
+            now = now or datetime.now()
             machine_record = {
                 'machine_id': machine_id,
                 'hostname': static_data.get('os', {}).get('hostname', 'Unknown'),
                 'os_name': static_data.get('os', {}).get('nom', 'Unknown'),
-                'last_seen': datetime.now(),
+                'last_seen': now,
                 'status': 'active'
             }
-            existing = self.machine_ids_collection.find_one({'machine_id': machine_id})
-            if existing:
-                self.machine_ids_collection.update_one(
-                    {'machine_id': machine_id},
-                    {'$set': machine_record}
-                )
-            else:
-                machine_record['first_seen'] = datetime.now()
-                self.machine_ids_collection.insert_one(machine_record)
+            # Single round trip: first_seen is only written when the upsert creates the record
+            self.machine_ids_collection.update_one(
+                {'machine_id': machine_id},
+                {'$set': machine_record, '$setOnInsert': {'first_seen': now}},
+                upsert=True
+            )
+            self.known_machine_ids.add(machine_id)
             logging.info(f"Machine {machine_id} registered")
             return True
         except Exception as e:
             logging.error(f"Error registering machine: {e}\n{traceback.format_exc()}")
             return False
 
-    def save_static_data(self, machine_id, data):
+    def save_static_data(self, machine_id, data, now=None):
         """Save static data to MongoDB."""
         try:
+            memoire = dict(data.get('memoire') or {})
+            ram = dict(memoire.get('ram') or {})
+            ram['total_gb'] = memory_to_gb(ram.get('total'))
+            memoire['ram'] = ram
             static_doc = {
                 'machine_id': machine_id,
-                'timestamp': datetime.now(),
-                'data_received': data.get('timestamp', ''),
-                'os': data.get('os', {}),
-                'type_machine': data.get('type_machine', 0),
-                'cpu': data.get('cpu', {}),
-                'memoire': data.get('memoire', {}),
-                'disque': data.get('disque', {}),
-                'adresse_mac': data.get('adresse_mac', ''),
-                'resolution_ecran': data.get('resolution_ecran', ''),
-                'gpu': data.get('gpu', {}),
-                'interfaces_reseau': data.get('interfaces_reseau', []),
-                'bios_carte_mere': data.get('bios_carte_mere', {}),
-                'utilisateurs_connectes': data.get('utilisateurs_connectes', []),
-                'partitions_disque': data.get('partitions_disque', []),
-                'peripheriques_usb': data.get('peripheriques_usb', []),
-                'battery_initial': data.get('battery_initial', {}),
-                'heure_demarrage_systeme': data.get('heure_demarrage_systeme', '')
+                'timestamp': now or datetime.now(),
+                'data_received': data.get('timestamp', '')
             }
+            static_doc.update({key: data[key] if key in data else default for key, default in STATIC_FIELDS.items()})
+            static_doc['memoire'] = memoire
             self.static_collection.update_one(
                 {'machine_id': machine_id},
                 {'$set': static_doc},
@@ -152,35 +224,50 @@ class ZipDataProcessor:
             logging.error(f"Error saving static data: {e}\n{traceback.format_exc()}")
             return False
 
-    def save_variable_data(self, machine_id, data):
+    def save_variable_data(self, machine_id, data, filename, now=None):
         """Save variable data to MongoDB."""
         try:
+            reseau = dict(data.get('reseau') or {})
+            reseau['octets_envoyes_mb'] = traffic_to_mb(reseau.get('octets_envoyes'))
+            reseau['octets_recus_mb'] = traffic_to_mb(reseau.get('octets_recus'))
             variable_doc = {
                 'machine_id': machine_id,
-                'timestamp': datetime.now(),
-                'data_received': data.get('timestamp', ''),
-                'cpu': data.get('cpu', {}),
-                'memoire': data.get('memoire', {}),
-                'disque': data.get('disque', {}),
-                'gpu_utilisation': data.get('gpu_utilisation', {}),
-                'reseau': data.get('reseau', {}),
-                'connexion_internet': data.get('connexion_internet', False),
-                'nombre_processus': data.get('nombre_processus', 0),
-                'battery': data.get('battery', {}),
-                'uptime': data.get('uptime', ''),
-                'seuil_atteint': data.get('seuil_atteint', {})
+                # Ingest time, as server.py stores receive time; the sample's own time is kept alongside
+                'timestamp': now or datetime.now(),
+                'sample_timestamp': sample_time(data),
+                'data_received': data.get('timestamp', '')
             }
-            result = self.variable_collection.insert_one(variable_doc)
-            self.machine_ids_collection.update_one(
-                {'machine_id': machine_id},
-                {'$set': {'last_seen': datetime.now()}}
-            )
-            logging.info(f"Variable data saved for {machine_id}, document ID: {result.inserted_id}")
+            variable_doc.update({key: data[key] if key in data else default for key, default in VARIABLE_FIELDS.items()})
+            variable_doc['reseau'] = reseau
+            variable_doc['uptime_seconds'] = uptime_to_seconds(variable_doc['uptime'])
+            self.pending_variable_docs.append(variable_doc)
+            self.pending_variable_files.append(filename)
+            if len(self.pending_variable_docs) >= VARIABLE_BATCH_SIZE:
+                # A failed batch is reported with all the files it covered, not just this one
+                self.flush_variable_data()
             return True
         except Exception as e:
             logging.error(f"Error saving variable data: {e}\n{traceback.format_exc()}")
             return False
 
+    def flush_variable_data(self):
+        """Insert the buffered variable documents in one batch."""
+        if not self.pending_variable_docs:
+            return True
+        docs, self.pending_variable_docs = self.pending_variable_docs, []
+        files, self.pending_variable_files = self.pending_variable_files, []
+        try:
+            result = self.variable_collection.insert_many(docs, ordered=False)
+            logging.info(f"Variable data saved, {len(result.inserted_ids)} documents")
+            return True
+        except Exception as e:
+            self.failed_variable_batches += 1
+            logging.error(
+                f"Error saving variable data: batch of {len(docs)} documents not saved, "
+                f"files {', '.join(files)}: {e}\n{traceback.format_exc()}"
+            )
+            return False
+
     def cleanup_old_data(self):
         """Remove old variable data from MongoDB."""
         try:
@@ -188,22 +275,22 @@ class ZipDataProcessor:
             result = self.variable_collection.delete_many({'timestamp': {'$lt': cutoff}})
             logging.info(f"Deleted {result.deleted_count} variable data documents older than {cutoff}")
         except Exception as e:
-            logging.error(f"Error cleaning up old data: \n {traceback.format_exc()}")
+            logging.error(f"Error cleaning up old data: {e}\n{traceback.format_exc()}")
 
-    def process_data(self, data, filename, known_machine_id=None):
+    def process_data(self, data, filename, known_machine_id=None, now=None):
         """Process data from a JSON file, using known_machine_id if available."""
         try:
             if not data:
                 logging.error(f"Empty data in {filename}")
                 return None
             if 'os' in data:
-                StaticData(**data)
+                StaticData.model_validate(data)
                 logging.info(f"Processing static data from {filename}")
                 machine_id = self.generate_machine_id(data)
-                if not machine_id or not self.register_machine(machine_id, data):
+                if not machine_id or not self.register_machine(machine_id, data, now):
                     logging.error(f"Failed to register machine for {filename}")
                     return None
-                if not self.save_static_data(machine_id, data):
+                if not self.save_static_data(machine_id, data, now):
                     logging.error(f"Failed to save static data for {filename}")
                     return None
                 return machine_id
@@ -214,10 +301,12 @@ class ZipDataProcessor:
                     logging.error(f"No machine_id available for variable data in {filename}")
                     return None
                 logging.info(f"Processing variable data for {machine_id} from {filename}")
-                if not self.machine_ids_collection.find_one({'machine_id': machine_id}):
-                    logging.error(f"Machine ID {machine_id} not found in database for {filename}")
-                    return None
-                if not self.save_variable_data(machine_id, data):
+                if machine_id not in self.known_machine_ids:
+                    if not self.machine_ids_collection.find_one({'machine_id': machine_id}, {'_id': 1}):
+                        logging.error(f"Machine ID {machine_id} not found in database for {filename}")
+                        return None
+                    self.known_machine_ids.add(machine_id)
+                if not self.save_variable_data(machine_id, data, filename, now):
                     logging.error(f"Failed to save variable data for {filename}")
                     return None
                 return machine_id
@@ -228,100 +317,115 @@ class ZipDataProcessor:
             logging.error(f"Error processing {filename}: {e}\n{traceback.format_exc()}")
             return None
 
-    def find_data_directory(self, temp_dir):
-        """Find the data directory in the unzipped folder."""
-        data_dir = os.path.join(temp_dir, 'data')
-        if os.path.exists(data_dir) and os.path.isdir(data_dir):
-            return data_dir
-        subdirs = [d for d in os.listdir(temp_dir) if os.path.isdir(os.path.join(temp_dir, d))]
+    def find_data_directory(self, names):
+        """Find the data directory among the zip entries; returns its prefix ('data/' or '<folder>/data/')."""
+        if any(name.startswith('data/') for name in names):
+            return 'data/'
+        subdirs = {name.split('/', 1)[0] for name in names if '/' in name}
         if len(subdirs) == 1:
-            data_dir = os.path.join(temp_dir, subdirs[0], 'data')
-            if os.path.exists(data_dir) and os.path.isdir(data_dir):
+            data_dir = f"{subdirs.pop()}/data/"
+            if any(name.startswith(data_dir) for name in names):
                 return data_dir
         return None
 
-    def find_machine_id_file(self, temp_dir):
-        """Find the machine_id.txt file in the unzipped folder."""
-        machine_id_file = os.path.join(temp_dir, 'machine_id.txt')
-        if os.path.exists(machine_id_file):
-            return machine_id_file
-        subdirs = [d for d in os.listdir(temp_dir) if os.path.isdir(os.path.join(temp_dir, d))]
+    def find_machine_id_file(self, names):
+        """Find the machine_id.txt entry in the zip."""
+        if 'machine_id.txt' in names:
+            return 'machine_id.txt'
+        subdirs = {name.split('/', 1)[0] for name in names if '/' in name}
         if len(subdirs) == 1:
-            machine_id_file = os.path.join(temp_dir, subdirs[0], 'machine_id.txt')
-            if os.path.exists(machine_id_file):
+            machine_id_file = f"{subdirs.pop()}/machine_id.txt"
+            if machine_id_file in names:
                 return machine_id_file
         return None
 
-    def is_valid_json_file(self, file_path):
-        """Check if a .json.gz file is valid and non-empty."""
+    def load_json_file(self, zip_ref, entry):
+        """Decompress and parse a .json.gz zip entry in one pass; None if it is empty, invalid or corrupted."""
         try:
-            with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                content = f.read().strip()
-                if not content:
-                    logging.warning(f"File {file_path} is empty")
-                    return False
-                json.loads(content)  # Try parsing to ensure valid JSON
-                return True
-        except (gzip.BadGzipFile, json.JSONDecodeError) as e:
-            logging.warning(f"File {file_path} is invalid or corrupted: {e}")
-            return False
+            # Entries hold one small sample: read straight from the zip and decompress in a single call
+            content = gzip.decompress(zip_ref.read(entry))
+            if not content.strip():
+                logging.warning(f"File {entry} is empty")
+                return None
+            return orjson.loads(content)
+        except (zipfile.BadZipFile, gzip.BadGzipFile, zlib.error, orjson.JSONDecodeError, EOFError) as e:
+            logging.warning(f"File {entry} is invalid or corrupted: {e}")
+            return None
         except Exception as e:
-            logging.error(f"Error checking {file_path}: {e}\n{traceback.format_exc()}")
-            return False
+            logging.error(f"Error reading {entry}: {e}\n{traceback.format_exc()}")
+            return None
 
     def process_zipped_folder(self, zip_path):
         """Process a zipped folder containing system-monitor data."""
         try:
-            # Create a temporary directory
-            with tempfile.TemporaryDirectory() as temp_dir:
-                logging.info(f"Extracting zip file {zip_path} to {temp_dir}")
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
+            # Entries are read directly from the archive, nothing is extracted to disk
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                logging.info(f"Reading zip file {zip_path}")
+                names = set(zip_ref.namelist())
 
                 # Find machine_id.txt
-                machine_id_file = self.find_machine_id_file(temp_dir)
+                machine_id_file = self.find_machine_id_file(names)
                 if machine_id_file:
-                    with open(machine_id_file, 'r') as f:
-                        self.machine_id = f.read().strip()
+                    self.machine_id = zip_ref.read(machine_id_file).decode('utf-8').strip()
                     logging.info(f"Found machine ID: {self.machine_id}")
 
                 # Find data directory
-                data_dir = self.find_data_directory(temp_dir)
+                data_dir = self.find_data_directory(names)
                 if not data_dir:
                     logging.error(f"No data directory found in {zip_path}")
                     return False
 
-                # Process data files
-                json_files = sorted([f for f in os.listdir(data_dir) if f.endswith('.json.gz')])
+                # Process data files (file name -> zip entry)
+                entries = {
+                    name[len(data_dir):]: name for name in names
+                    if name.startswith(data_dir) and name.endswith('.json.gz') and '/' not in name[len(data_dir):]
+                }
+                json_files = sorted(entries, key=file_number)
                 if not json_files:
-                    logging.error(f"No .json.gz files found in {data_dir}")
+                    logging.error(f"No .json.gz files found in {zip_path}:{data_dir}")
                     return False
 
                 # Prioritize static data (1.json.gz) if machine_id is not provided
                 if not self.machine_id and '1.json.gz' in json_files:
-                    json_files = ['1.json.gz'] + [f for f in json_files if f != '1.json.gz']
-
-                for json_file in json_files:
-                    file_path = os.path.join(data_dir, json_file)
-                    # Check if file is valid before processing
-                    if not self.is_valid_json_file(file_path):
-                        logging.error(f"Skipping {json_file} due to invalid or empty content")
-                        continue
-                    try:
-                        with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                            file_data = json.load(f)
-                        
-                        # Process the data, passing the known machine_id
-                        processed_machine_id = self.process_data(file_data, json_file, self.machine_id)
-                        if processed_machine_id:
-                            self.machine_id = processed_machine_id
-                            logging.info(f"Successfully processed {json_file} for machine {self.machine_id}")
-                        else:
-                            logging.error(f"Failed to process {json_file}")
-                    except Exception as e:
-                        logging.error(f"Error processing {file_path}: {e}\n{traceback.format_exc()}")
-                        continue  # Continue processing other files
+                    json_files.remove('1.json.gz')
+                    json_files.insert(0, '1.json.gz')
 
+                # Entries are decompressed and parsed in worker threads (zlib releases the GIL), at most
+                # LOAD_AHEAD files ahead; results are consumed in json_files order, static file first
+                now = datetime.now()  # One ingest time for the whole archive
+                with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
+                    remaining = deque(json_files)
+                    in_flight = deque()
+                    while remaining or in_flight:
+                        while remaining and len(in_flight) < LOAD_AHEAD:
+                            json_file = remaining.popleft()
+                            in_flight.append((json_file, executor.submit(self.load_json_file, zip_ref, entries[json_file])))
+                        json_file, future = in_flight.popleft()
+                        file_entry, file_data = entries[json_file], future.result()
+                        if file_data is None:
+                            logging.error(f"Skipping {json_file} due to invalid or empty content")
+                            continue
+                        try:
+                            # Process the data, passing the known machine_id
+                            processed_machine_id = self.process_data(file_data, json_file, self.machine_id, now)
+                            if processed_machine_id:
+                                self.machine_id = processed_machine_id
+                                logging.info(f"Successfully processed {json_file} for machine {self.machine_id}")
+                            else:
+                                logging.error(f"Failed to process {json_file}")
+                        except Exception as e:
+                            logging.error(f"Error processing {file_entry}: {e}\n{traceback.format_exc()}")
+                            continue  # Continue processing other files
+
+                if not self.flush_variable_data() or self.failed_variable_batches:
+                    logging.error(f"{self.failed_variable_batches} variable data batches failed for {zip_path}")
+                    return False
+                # Touch last_seen once for the whole archive
+                if self.machine_id:
+                    self.machine_ids_collection.update_one(
+                        {'machine_id': self.machine_id},
+                        {'$set': {'last_seen': now}}
+                    )
                 return True
         except Exception as e:
             logging.error(f"Error processing zip file {zip_path}: {e}\n{traceback.format_exc()}")
@@ -2,29 +2,77 @@
 # -*- coding: utf-8 -*-
 
 import socket
-import json
+import orjson
+import gzip
 import hashlib
 import threading
+import itertools
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 import logging
+import re
 import traceback
 from pydantic import BaseModel, ValidationError
 from concurrent.futures import ThreadPoolExecutor
 import signal
 import sys
+import os
+import queue
+import selectors
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
 
 # Configuration
 SERVER_HOST = '0.0.0.0'
 SERVER_PORT = 12345
 MONGO_HOST = 'localhost'
 MONGO_PORT = 27017
+MONGO_COMPRESSORS = 'zlib'  # Compression réseau ; mettre 'zstd,' en tête si le paquet zstandard est installé
 DATABASE_NAME = 'machine_monitoring'
 STATIC_COLLECTION = 'static_data'
 VARIABLE_COLLECTION = 'variable_data'
 MACHINE_IDS_COLLECTION = 'machine_ids'
 DATA_RETENTION_DAYS = 30
-MAX_CONCURRENT_CONNECTIONS = 50  # Maximum number of concurrent clients
+MAX_CONCURRENT_CONNECTIONS = 50  # Maximum number of messages processed concurrently (worker threads)
+MAX_OPEN_CONNECTIONS = 1000  # Connexions clients ouvertes simultanément, au-delà rejetées
+ACCEPT_THREADS = os.cpu_count() or 4  # Threads appelant accept() en parallèle sur la socket d'écoute
+LISTEN_BACKLOG = min(socket.SOMAXCONN, MAX_OPEN_CONNECTIONS)  # File d'attente des connexions non acceptées
+MAX_OPEN_FILES = 65536  # Limite souple RLIMIT_NOFILE visée au démarrage (bornée par la limite dure)
+RECV_SIZE = 65536  # Octets lus par appel à recv()
+VARIABLE_BATCH_SIZE = 100  # Documents variables par insert_many
+VARIABLE_FLUSH_INTERVAL = 0.5  # Délai max (s) avant écriture des documents variables en attente
+VARIABLE_MAX_PENDING = 100000  # Documents variables gardés pour un nouvel essai pendant une panne MongoDB
+
+# Champs copiés tels quels dans les documents, avec leur valeur par défaut
+STATIC_FIELDS = {
+    'os': {}, 'type_machine': 0, 'cpu': {}, 'memoire': {}, 'disque': {}, 'adresse_mac': '',
+    'resolution_ecran': '', 'gpu': {}, 'interfaces_reseau': [], 'bios_carte_mere': {},
+    'utilisateurs_connectes': [], 'partitions_disque': [], 'peripheriques_usb': [],
+    'battery_initial': {}, 'heure_demarrage_systeme': ''
+}
+VARIABLE_FIELDS = {
+    'cpu': {}, 'memoire': {}, 'disque': {}, 'gpu_utilisation': {}, 'reseau': {},
+    'connexion_internet': False, 'nombre_processus': 0, 'battery': {}, 'uptime': '', 'seuil_atteint': {}
+}
+
+def encode_response(status, message, **fields):
+    """Encode une réponse au client : une ligne JSON terminée par '\n'."""
+    return orjson.dumps({'status': status, **fields, 'message': message}) + b'\n'
+
+# Réponses fixes, encodées une seule fois
+RESP_VARIABLE_SAVED = encode_response('success', 'Variable data saved')
+RESP_RESEND_STATIC = encode_response('error', 'RESEND_STATIC_DATA')
+RESP_INVALID_VERSION = encode_response('error', 'Invalid data version')
+RESP_INVALID_FORMAT = encode_response('error', 'Invalid data format')
+RESP_INVALID_JSON = encode_response('error', 'Invalid JSON')
+RESP_TOO_MANY = encode_response('error', 'Too many connections')
+RESP_REGISTER_FAILED = encode_response('error', 'Failed to register machine')
+RESP_STATIC_FAILED = encode_response('error', 'Failed to save static data')
+RESP_VARIABLE_FAILED = encode_response('error', 'Failed to save variable data')
 
 # Configuration du logging
 logging.basicConfig(
@@ -36,6 +84,42 @@ logging.basicConfig(
     ]
 )
 
+MEMORY_RE = re.compile(r'(\d+\.?\d*)\s*(GB|MB|TB)', re.IGNORECASE)
+TRAFFIC_RE = re.compile(r'(\d+\.?\d*)\s*(MB|GB|KB)', re.IGNORECASE)
+UPTIME_RE = re.compile(r'(?:(\d+) days?, )?(\d+):(\d+):(\d+)')
+
+def memory_to_gb(value):
+    """Convertit une taille mémoire ('15.8 GB') en Go, 0 si illisible."""
+    match = MEMORY_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return 0.0
+    amount, unit = float(match.group(1)), match.group(2).upper()
+    if unit == 'MB':
+        return amount / 1024.0
+    if unit == 'TB':
+        return amount * 1024.0
+    return amount
+
+def traffic_to_mb(value):
+    """Convertit un trafic réseau ('1.23 MB') en Mo, 0 si illisible."""
+    match = TRAFFIC_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return 0.0
+    amount, unit = float(match.group(1)), match.group(2).upper()
+    if unit == 'KB':
+        return amount / 1024.0
+    if unit == 'GB':
+        return amount * 1024.0
+    return amount
+
+def uptime_to_seconds(value):
+    """Convertit un uptime ('1 day, 2:30:00.123') en secondes entières, 0 si illisible."""
+    match = UPTIME_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        return 0
+    days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
 class StaticData(BaseModel):
     os: dict
     cpu: dict
@@ -44,25 +128,91 @@ class StaticData(BaseModel):
     utilisateurs_connectes: list
     adresse_mac: str
 
+class ClientConnection:
+    """État d'un client : socket, tampon de réception et en-tête en attente de sa charge gzip.
+
+    La connexion appartient soit au thread de lecture, soit à un thread du pool, jamais aux deux à la fois.
+    """
+    def __init__(self, client_socket, client_address):
+        self.socket = client_socket
+        self.address = client_address
+        # Tampon modifié sur place ; scan_from évite de rechercher à nouveau '\n' dans les octets déjà examinés
+        self.data = bytearray()
+        self.scan_from = 0
+        self.header = None
+
+    def has_message(self):
+        """Indique si le tampon contient au moins un message complet à traiter."""
+        if self.header is not None:
+            return len(self.data) >= self.header['gz_len']
+        if self.data.find(b'\n', self.scan_from) < 0:
+            self.scan_from = len(self.data)
+            return False
+        return True
+
 class MonitoringServer:
     def __init__(self):
+        self.raise_open_files_limit()
         try:
-            self.mongo_client = MongoClient(MONGO_HOST, MONGO_PORT)
+            # Pool dimensionné pour les threads de traitement (plus le thread d'écriture) sans attente de connexion
+            self.mongo_client = MongoClient(
+                MONGO_HOST, MONGO_PORT,
+                maxPoolSize=MAX_CONCURRENT_CONNECTIONS * 2, minPoolSize=MAX_CONCURRENT_CONNECTIONS,
+                socketTimeoutMS=20000, retryWrites=True, compressors=MONGO_COMPRESSORS
+            )
             self.db = self.mongo_client[DATABASE_NAME]
             self.static_collection = self.db[STATIC_COLLECTION]
             self.variable_collection = self.db[VARIABLE_COLLECTION]
             self.machine_ids_collection = self.db[MACHINE_IDS_COLLECTION]
             self.static_collection.create_index("machine_id")
+            self.static_collection.create_index([("cpu.coeurs_logiques", 1), ("memoire.ram.total_gb", 1)])
             self.variable_collection.create_index([("machine_id", 1), ("timestamp", 1)])
             self.machine_ids_collection.create_index("machine_id", unique=True)
             logging.info("Connexion MongoDB établie")
             self.cleanup_old_data()
-            self.active_connections = 0
+            # Places de connexion : acquises sans blocage, pas de verrou sur le chemin d'acceptation
+            self.connection_slots = threading.BoundedSemaphore(MAX_OPEN_CONNECTIONS)
+            # Connexions ouvertes/fermées, pour les journaux uniquement (next() sur itertools.count est atomique)
+            self.connections_opened = itertools.count(1)
+            self.connections_closed = itertools.count(1)
+            self.opened_total = 0
+            self.closed_total = 0
             self.lock = threading.Lock()
+            # IDs machines enregistrés, chargés au démarrage : évite un find_one par message variable
+            self.known_machine_ids = set(self.machine_ids_collection.distinct('machine_id'))
+            # Documents variables en attente d'écriture groupée, et dernier last_seen par machine
+            self.pending_variable_docs = []
+            self.pending_last_seen = {}
+            self.variable_lock = threading.Lock()
+            self.flush_stop = threading.Event()
+            self.flush_thread = threading.Thread(target=self.flush_loop, daemon=True)
+            self.flush_thread.start()
+            self.accept_stop = threading.Event()
+            # Lecture des sockets clients : un sélecteur, et une paire de sockets pour réveiller select()
+            self.selector = selectors.DefaultSelector()
+            self.io_queue = queue.SimpleQueue()
+            self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+            self.wakeup_reader.setblocking(False)
+            self.wakeup_writer.setblocking(False)
+            self.selector.register(self.wakeup_reader, selectors.EVENT_READ, None)
         except Exception as e:
             logging.error(f"Erreur connexion MongoDB: {e}\n{traceback.format_exc()}")
             raise
 
+    def raise_open_files_limit(self):
+        """Relève la limite souple de descripteurs ouverts pour que MAX_CONCURRENT_CONNECTIONS puisse croître."""
+        if not RESOURCE_AVAILABLE:
+            return
+        try:
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            target = MAX_OPEN_FILES if hard == resource.RLIM_INFINITY else min(hard, MAX_OPEN_FILES)
+            if target > soft:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+                soft = target
+            logging.info(f"Limite de fichiers ouverts: {soft}")
+        except (ValueError, OSError) as e:
+            logging.error(f"Erreur relèvement limite fichiers: {e}\n{traceback.format_exc()}")
+
     def generate_machine_id(self, static_data):
         """Génère un ID machine basé sur les caractéristiques statiques."""
         try:
@@ -72,74 +222,70 @@ class MonitoringServer:
             memoire_info = static_data.get('memoire', {})
             users = static_data.get('utilisateurs_connectes', [])
             username = users[0].get('username', '') if users else ''
-            unique_string = (
-                f"{os_info.get('hostname', '')}"
-                f"{os_info.get('nom', '')}"
-                f"{os_info.get('release', '')}"
-                f"{os_info.get('version', '')}"
-                f"{username}"
-                f"{cpu_info.get('coeurs_logiques', 0)}"
-                f"{cpu_info.get('frequence', {}).get('min', 0)}"
-                f"{cpu_info.get('frequence', {}).get('max', 0)}"
-                f"{bios_info.get('BIOS', {}).get('Fabricant', '')}"
-                f"{bios_info.get('BIOS', {}).get('Version', '')}"
-                f"{bios_info.get('Carte mère', {}).get('Fabricant', '')}"
-                f"{bios_info.get('Carte mère', {}).get('Modèle', '')}"
-                f"{memoire_info.get('ram', {}).get('total', '')}"
+            components = (
+                os_info.get('hostname', ''),
+                os_info.get('nom', ''),
+                os_info.get('release', ''),
+                os_info.get('version', ''),
+                username,
+                cpu_info.get('coeurs_logiques', 0),
+                cpu_info.get('frequence', {}).get('min', 0),
+                cpu_info.get('frequence', {}).get('max', 0),
+                bios_info.get('BIOS', {}).get('Fabricant', ''),
+                bios_info.get('BIOS', {}).get('Version', ''),
+                bios_info.get('Carte mère', {}).get('Fabricant', ''),
+                bios_info.get('Carte mère', {}).get('Modèle', ''),
+                memoire_info.get('ram', {}).get('total', '')
             )
-            return hashlib.md5(unique_string.encode('utf-8')).hexdigest()
+            # Alimenté morceau par morceau, sans séparateur : même empreinte que l'ancienne chaîne concaténée,
+            # les IDs déjà enregistrés (et ceux de process_zipped_data.py) restent valides
+            digest = hashlib.md5()
+            for component in components:
+                digest.update(str(component).encode('utf-8'))
+            return digest.hexdigest()
         except Exception as e:
             logging.error(f"Erreur génération ID machine: {e}\n{traceback.format_exc()}")
             return None
 
-    def register_machine(self, machine_id, static_data):
+    def register_machine(self, machine_id, static_data, now=None):
         """Enregistre une machine dans la base."""
         try:
+            now = now or datetime.now()
             machine_record = {
                 'machine_id': machine_id,
                 'hostname': static_data.get('os', {}).get('hostname', 'Unknown'),
                 'os_name': static_data.get('os', {}).get('nom', 'Unknown'),
-                'last_seen': datetime.now(),
+                'last_seen': now,
                 'status': 'active'
             }
-            existing = self.machine_ids_collection.find_one({'machine_id': machine_id})
-            if existing:
-                self.machine_ids_collection.update_one(
-                    {'machine_id': machine_id},
-                    {'$set': machine_record}
-                )
-            else:
-                machine_record['first_seen'] = datetime.now()
-                self.machine_ids_collection.insert_one(machine_record)
+            # Un seul aller-retour, sans course entre deux premiers enregistrements : first_seen n'est écrit qu'à la création
+            self.machine_ids_collection.update_one(
+                {'machine_id': machine_id},
+                {'$set': machine_record, '$setOnInsert': {'first_seen': now}},
+                upsert=True
+            )
+            with self.lock:
+                self.known_machine_ids.add(machine_id)
             logging.info(f"Machine {machine_id} enregistrée")
             return True
         except Exception as e:
             logging.error(f"Erreur enregistrement machine: {e}\n{traceback.format_exc()}")
             return False
 
-    def save_static_data(self, machine_id, data):
+    def save_static_data(self, machine_id, data, now=None):
         """Sauvegarde les données statiques."""
         try:
+            memoire = dict(data.get('memoire') or {})
+            ram = dict(memoire.get('ram') or {})
+            ram['total_gb'] = memory_to_gb(ram.get('total'))
+            memoire['ram'] = ram
             static_doc = {
                 'machine_id': machine_id,
-                'timestamp': datetime.now(),
-                'data_received': data.get('timestamp', ''),
-                'os': data.get('os', {}),
-                'type_machine': data.get('type_machine', 0),
-                'cpu': data.get('cpu', {}),
-                'memoire': data.get('memoire', {}),
-                'disque': data.get('disque', {}),
-                'adresse_mac': data.get('adresse_mac', ''),
-                'resolution_ecran': data.get('resolution_ecran', ''),
-                'gpu': data.get('gpu', {}),
-                'interfaces_reseau': data.get('interfaces_reseau', []),
-                'bios_carte_mere': data.get('bios_carte_mere', {}),
-                'utilisateurs_connectes': data.get('utilisateurs_connectes', []),
-                'partitions_disque': data.get('partitions_disque', []),
-                'peripheriques_usb': data.get('peripheriques_usb', []),
-                'battery_initial': data.get('battery_initial', {}),
-                'heure_demarrage_systeme': data.get('heure_demarrage_systeme', '')
+                'timestamp': now or datetime.now(),
+                'data_received': data.get('timestamp', '')
             }
+            static_doc.update({key: data[key] if key in data else default for key, default in STATIC_FIELDS.items()})
+            static_doc['memoire'] = memoire
             self.static_collection.update_one(
                 {'machine_id': machine_id},
                 {'$set': static_doc},
@@ -151,119 +297,278 @@ class MonitoringServer:
             logging.error(f"Erreur sauvegarde statique: {e}\n{traceback.format_exc()}")
             return False
 
-    def save_variable_data(self, machine_id, data):
+    def save_variable_data(self, machine_id, data, now=None):
         """Sauvegarde les données variables."""
         try:
+            reseau = dict(data.get('reseau') or {})
+            reseau['octets_envoyes_mb'] = traffic_to_mb(reseau.get('octets_envoyes'))
+            reseau['octets_recus_mb'] = traffic_to_mb(reseau.get('octets_recus'))
             variable_doc = {
                 'machine_id': machine_id,
-                'timestamp': datetime.now(),
-                'data_received': data.get('timestamp', ''),
-                'cpu': data.get('cpu', {}),
-                'memoire': data.get('memoire', {}),
-                'disque': data.get('disque', {}),
-                'gpu_utilisation': data.get('gpu_utilisation', {}),
-                'reseau': data.get('reseau', {}),
-                'connexion_internet': data.get('connexion_internet', False),
-                'nombre_processus': data.get('nombre_processus', 0),
-                'battery': data.get('battery', {}),
-                'uptime': data.get('uptime', ''),
-                'seuil_atteint': data.get('seuil_atteint', {})
+                'timestamp': now or datetime.now(),
+                'data_received': data.get('timestamp', '')
             }
-            result = self.variable_collection.insert_one(variable_doc)
-            self.machine_ids_collection.update_one(
-                {'machine_id': machine_id},
-                {'$set': {'last_seen': datetime.now()}}
-            )
-            logging.info(f"Données variables sauvegardées pour {machine_id}, ID document: {result.inserted_id}")
+            variable_doc.update({key: data[key] if key in data else default for key, default in VARIABLE_FIELDS.items()})
+            variable_doc['reseau'] = reseau
+            variable_doc['uptime_seconds'] = uptime_to_seconds(variable_doc['uptime'])
+            with self.variable_lock:
+                self.pending_variable_docs.append(variable_doc)
+                self.pending_last_seen[machine_id] = variable_doc['timestamp']
+                batch_full = len(self.pending_variable_docs) >= VARIABLE_BATCH_SIZE
+            if batch_full:
+                self.flush_variable_docs()
             return True
         except Exception as e:
             logging.error(f"Erreur sauvegarde variable: {e}\n{traceback.format_exc()}")
             return False
 
+    def flush_variable_docs(self):
+        """Écrit les documents variables en attente en un insert_many.
+
+        L'agent a déjà reçu 'Variable data saved' et supprimé son fichier : un lot en échec est
+        journalisé et remis en attente pour le vidage suivant au lieu d'être perdu.
+        """
+        with self.variable_lock:
+            docs, self.pending_variable_docs = self.pending_variable_docs, []
+        if not docs:
+            return
+        try:
+            self.variable_collection.insert_many(docs, ordered=False)
+            logging.info(f"Données variables sauvegardées, {len(docs)} documents")
+        except BulkWriteError as e:
+            # Refus document par document : un nouvel essai échouerait de même, sauf les doublons déjà écrits
+            rejected = [error for error in e.details.get('writeErrors', []) if error.get('code') != 11000]
+            machine_ids = sorted({docs[error['index']]['machine_id'] for error in rejected})
+            logging.error(
+                f"Erreur sauvegarde variable: {len(rejected)} documents sur {len(docs)} refusés "
+                f"(machines {machine_ids}): {rejected[0]['errmsg'] if rejected else e}\n{traceback.format_exc()}"
+            )
+        except Exception as e:
+            with self.variable_lock:
+                self.pending_variable_docs[:0] = docs
+                dropped = len(self.pending_variable_docs) - VARIABLE_MAX_PENDING
+                if dropped > 0:
+                    del self.pending_variable_docs[:dropped]
+            logging.error(f"Erreur sauvegarde variable, lot de {len(docs)} documents remis en attente: {e}\n{traceback.format_exc()}")
+            if dropped > 0:
+                logging.error(f"Tampon variable plein, {dropped} documents les plus anciens abandonnés")
+
+    def flush_variable_data(self):
+        """Écrit les documents en attente puis met à jour last_seen, un seul UpdateOne par machine, en un bulk_write."""
+        self.flush_variable_docs()
+        with self.variable_lock:
+            last_seen, self.pending_last_seen = self.pending_last_seen, {}
+        if not last_seen:
+            return
+        try:
+            self.machine_ids_collection.bulk_write(
+                [UpdateOne({'machine_id': machine_id}, {'$set': {'last_seen': seen}}) for machine_id, seen in last_seen.items()],
+                ordered=False
+            )
+        except Exception as e:
+            logging.error(f"Erreur mise à jour last_seen: {e}\n{traceback.format_exc()}")
+
+    def flush_loop(self):
+        """Vide le tampon des données variables toutes les VARIABLE_FLUSH_INTERVAL secondes."""
+        while not self.flush_stop.wait(VARIABLE_FLUSH_INTERVAL):
+            self.flush_variable_data()
+
     def cleanup_old_data(self):
-        """Supprime les données variables anciennes."""
+        """Confie la suppression des données variables anciennes à un index TTL, appliqué en continu par MongoDB."""
         try:
-            cutoff = datetime.now() - timedelta(days=DATA_RETENTION_DAYS)
-            result = self.variable_collection.delete_many({'timestamp': {'$lt': cutoff}})
-            logging.info(f"Données variables antérieures à {cutoff} supprimées, {result.deleted_count} documents")
+            expire_after = int(timedelta(days=DATA_RETENTION_DAYS).total_seconds())
+            try:
+                self.variable_collection.create_index("timestamp", expireAfterSeconds=expire_after)
+            except OperationFailure:
+                # Index TTL déjà créé avec une autre rétention : mise à jour sans reconstruction
+                self.db.command('collMod', VARIABLE_COLLECTION,
+                                index={'keyPattern': {'timestamp': 1}, 'expireAfterSeconds': expire_after})
+            logging.info(f"Index TTL des données variables: rétention {DATA_RETENTION_DAYS} jours")
         except Exception as e:
             logging.error(f"Erreur nettoyage données: {e}\n{traceback.format_exc()}")
 
     def process_data(self, data, client_address):
-        """Traite les données reçues."""
+        """Traite les données reçues et renvoie la réponse encodée."""
         try:
             if not data.get('version') == "1.0":
-                return {'status': 'error', 'message': 'Invalid data version'}
+                return RESP_INVALID_VERSION
             content = data.get('content')
+            now = datetime.now()  # Une seule heure de réception pour tout le message
             if 'os' in content:
-                StaticData(**content)
+                StaticData.model_validate(content)
                 logging.info(f"Données statiques reçues de {client_address}")
                 machine_id = self.generate_machine_id(content)
-                if not machine_id or not self.register_machine(machine_id, content):
-                    return {'status': 'error', 'message': 'Failed to register machine'}
-                if not self.save_static_data(machine_id, content):
-                    return {'status': 'error', 'message': 'Failed to save static data'}
-                return {'status': 'success', 'machine_id': machine_id, 'message': 'Static data registered'}
+                if not machine_id or not self.register_machine(machine_id, content, now):
+                    return RESP_REGISTER_FAILED
+                if not self.save_static_data(machine_id, content, now):
+                    return RESP_STATIC_FAILED
+                return encode_response('success', 'Static data registered', machine_id=machine_id)
             elif 'machine_id' in data:
                 machine_id = data.get('machine_id')
                 logging.info(f"Données variables reçues pour {machine_id}")
-                if not self.machine_ids_collection.find_one({'machine_id': machine_id}):
-                    return {'status': 'error', 'message': 'RESEND_STATIC_DATA'}
-                if not self.save_variable_data(machine_id, content):
-                    return {'status': 'error', 'message': 'Failed to save variable data'}
-                return {'status': 'success', 'message': 'Variable data saved'}
+                if machine_id not in self.known_machine_ids:
+                    # Machine enregistrée par un autre processus (process_zipped_data) depuis le démarrage ?
+                    if not self.machine_ids_collection.find_one({'machine_id': machine_id}, {'_id': 1}):
+                        return RESP_RESEND_STATIC
+                    with self.lock:
+                        self.known_machine_ids.add(machine_id)
+                if not self.save_variable_data(machine_id, content, now):
+                    return RESP_VARIABLE_FAILED
+                return RESP_VARIABLE_SAVED
             else:
-                return {'status': 'error', 'message': 'Invalid data format'}
+                return RESP_INVALID_FORMAT
         except ValidationError as e:
             logging.error(f"Données invalides de {client_address}: {e}\n{traceback.format_exc()}")
-            return {'status': 'error', 'message': 'Invalid data format'}
+            return RESP_INVALID_FORMAT
         except Exception as e:
             logging.error(f"Erreur traitement données: {e}\n{traceback.format_exc()}")
-            return {'status': 'error', 'message': str(e)}
+            return encode_response('error', str(e))
 
     def handle_client(self, client_socket, client_address):
-        """Gère un client, recevant plusieurs fichiers dans une connexion."""
+        """Prend en charge un client : la socket est confiée au thread de lecture, sans occuper de thread du pool."""
+        if not self.connection_slots.acquire(blocking=False):
+            logging.warning(f"Limite de connexions atteinte, rejet de {client_address}")
+            try:
+                client_socket.send(RESP_TOO_MANY)
+                client_socket.close()
+            except OSError:
+                pass
+            return
+        self.opened_total = next(self.connections_opened)
+        logging.info(f"Connexion de {client_address}, connexions actives: {self.opened_total - self.closed_total}")
+        self.resume_client(ClientConnection(client_socket, client_address))
+
+    def resume_client(self, connection):
+        """Rend une connexion au thread de lecture, qui l'inscrit dans le sélecteur."""
+        self.io_queue.put(connection)
+        self.wake_io_loop()
+
+    def wake_io_loop(self):
+        """Réveille le thread de lecture bloqué dans select()."""
         try:
-            with self.lock:
-                self.active_connections += 1
-                if self.active_connections > MAX_CONCURRENT_CONNECTIONS:
-                    logging.warning(f"Limite de connexions atteinte, rejet de {client_address}")
-                    client_socket.send(json.dumps({'status': 'error', 'message': 'Too many connections'}).encode('utf-8'))
-                    return
-                logging.info(f"Connexion de {client_address}, connexions actives: {self.active_connections}")
-
-            data = b""
+            self.wakeup_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Un réveil est déjà en attente, ou le serveur s'arrête
+
+    def close_client(self, connection):
+        """Ferme une connexion client et libère sa place."""
+        try:
+            connection.socket.close()
+        except:
+            pass
+        self.closed_total = next(self.connections_closed)
+        self.connection_slots.release()
+        logging.info(f"Connexion fermée avec {connection.address}, connexions actives: {self.opened_total - self.closed_total}")
+
+    def io_loop(self):
+        """Thread unique de lecture : attend les sockets prêtes et confie les messages complets au pool."""
+        while not self.accept_stop.is_set():
+            while not self.io_queue.empty():
+                connection = self.io_queue.get()
+                try:
+                    self.selector.register(connection.socket, selectors.EVENT_READ, connection)
+                except (ValueError, OSError) as e:
+                    logging.error(f"Erreur client {connection.address}: {e}\n{traceback.format_exc()}")
+                    self.close_client(connection)
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    self.wakeup_reader.recv(4096)
+                    continue
+                self.read_client(key.data)
+
+    def read_client(self, connection):
+        """Lit une socket prête ; dès qu'un message est complet, la connexion passe au pool jusqu'à sa réponse."""
+        try:
+            packet = connection.socket.recv(RECV_SIZE)
+        except OSError as e:
+            logging.error(f"Erreur réseau client {connection.address}: {e}\n{traceback.format_exc()}")
+            packet = b''
+        if not packet:
+            logging.info(f"Client {connection.address} a fermé la connexion")
+            self.selector.unregister(connection.socket)
+            self.close_client(connection)
+            return
+        connection.data += packet
+        if connection.has_message():
+            # Retirée du sélecteur pendant le traitement : messages traités dans l'ordre, lecture freinée si le pool est saturé
+            self.selector.unregister(connection.socket)
+            self.executor.submit(self.serve_client, connection)
+
+    def serve_client(self, connection):
+        """Traite les messages complets d'une connexion et envoie les réponses (thread du pool)."""
+        client_socket, client_address, data = connection.socket, connection.address, connection.data
+        try:
+            # Process complete messages: a JSON line (delimited by newline),
+            # optionally followed by a gzip payload of 'gz_len' bytes
             while True:
-                packet = client_socket.recv(4096)
-                if not packet:
-                    logging.info(f"Client {client_address} a fermé la connexion")
+                if connection.header is None:
+                    end = data.find(b'\n', connection.scan_from)
+                    if end < 0:
+                        connection.scan_from = len(data)
+                        break
+                    message = bytes(data[:end])
+                    del data[:end + 1]
+                    connection.scan_from = 0
+                elif len(data) < connection.header['gz_len']:
                     break
-                data += packet
-                # Process complete JSON messages (delimited by newline)
-                while b'\n' in data:
-                    message, _, data = data.partition(b'\n')
-                    try:
-                        json_data = json.loads(message.decode('utf-8'))
-                        response = self.process_data(json_data, client_address)
-                        client_socket.sendall(json.dumps(response).encode('utf-8') + b'\n')
-                    except json.JSONDecodeError as e:
-                        logging.error(f"JSON invalide de {client_address}: {e}\n{traceback.format_exc()}")
-                        client_socket.sendall(json.dumps({'status': 'error', 'message': 'Invalid JSON'}).encode('utf-8') + b'\n')
-                    except Exception as e:
-                        logging.error(f"Erreur traitement message de {client_address}: {e}\n{traceback.format_exc()}")
-                        client_socket.sendall(json.dumps({'status': 'error', 'message': str(e)}).encode('utf-8') + b'\n')
+                try:
+                    if connection.header is None:
+                        json_data = orjson.loads(message)
+                        if 'gz_len' in json_data:
+                            if not isinstance(json_data['gz_len'], int) or json_data['gz_len'] < 0:
+                                raise ValueError('Invalid gz_len')
+                            connection.header = json_data
+                            continue
+                    else:
+                        payload = data[:connection.header['gz_len']]
+                        del data[:connection.header['gz_len']]
+                        json_data, connection.header = connection.header, None
+                        json_data['content'] = orjson.loads(gzip.decompress(payload))
+                    client_socket.sendall(self.process_data(json_data, client_address))
+                except orjson.JSONDecodeError as e:
+                    logging.error(f"JSON invalide de {client_address}: {e}\n{traceback.format_exc()}")
+                    client_socket.sendall(RESP_INVALID_JSON)
+                except Exception as e:
+                    logging.error(f"Erreur traitement message de {client_address}: {e}\n{traceback.format_exc()}")
+                    client_socket.sendall(encode_response('error', str(e)))
         except (ConnectionResetError, BrokenPipeError) as e:
             logging.error(f"Erreur réseau client {client_address}: {e}\n{traceback.format_exc()}")
+            self.close_client(connection)
+            return
         except Exception as e:
             logging.error(f"Erreur client {client_address}: {e}\n{traceback.format_exc()}")
-        finally:
+            self.close_client(connection)
+            return
+        self.resume_client(connection)
+
+    def accept_loop(self, server_socket):
+        """Accepte les connexions ; plusieurs threads partagent la même socket d'écoute."""
+        while not self.accept_stop.is_set():
             try:
-                client_socket.close()
-            except:
-                pass
-            with self.lock:
-                self.active_connections -= 1
-            logging.info(f"Connexion fermée avec {client_address}, connexions actives: {self.active_connections}")
+                client_socket, client_address = server_socket.accept()
+            except OSError as e:
+                if not self.accept_stop.is_set():
+                    logging.error(f"Erreur acceptation: {e}\n{traceback.format_exc()}")
+                    self.accept_stop.set()
+                break
+            try:
+                # Réponses JSON courtes : pas d'attente de Nagle ; keepalive pour détecter les agents disparus
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            except OSError as e:
+                logging.warning(f"Options socket non appliquées pour {client_address}: {e}")
+            self.handle_client(client_socket, client_address)
+
+    def close_server_socket(self, server_socket):
+        """Arrête les threads d'acceptation et de lecture puis ferme la socket d'écoute."""
+        self.accept_stop.set()
+        self.wake_io_loop()
+        try:
+            # shutdown() réveille les accept() bloqués, close() seul ne le fait pas sous Linux
+            server_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        server_socket.close()
 
     def start_server(self):
         """Démarre le serveur avec un pool de threads."""
@@ -271,29 +576,33 @@ class MonitoringServer:
             server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             server_socket.bind((SERVER_HOST, SERVER_PORT))
-            server_socket.listen(MAX_CONCURRENT_CONNECTIONS)
-            logging.info(f"Serveur démarré sur {SERVER_HOST}:{SERVER_PORT}, max connexions: {MAX_CONCURRENT_CONNECTIONS}")
+            server_socket.listen(LISTEN_BACKLOG)
+            logging.info(f"Serveur démarré sur {SERVER_HOST}:{SERVER_PORT}, max connexions: {MAX_OPEN_CONNECTIONS}, traitements parallèles: {MAX_CONCURRENT_CONNECTIONS}")
 
             with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CONNECTIONS) as executor:
+                self.executor = executor
                 def shutdown_server(*args):
                     logging.info("Signal d'arrêt reçu, arrêt du serveur")
-                    server_socket.close()
-                    self.mongo_client.close()
+                    # Vidage final et fermeture du client MongoDB dans le finally, une fois le pool terminé
+                    self.close_server_socket(server_socket)
                     sys.exit(0)
 
                 signal.signal(signal.SIGINT, shutdown_server)
                 signal.signal(signal.SIGTERM, shutdown_server)
 
-                while True:
-                    client_socket, client_address = server_socket.accept()
-                    executor.submit(self.handle_client, client_socket, client_address)
+                threading.Thread(target=self.io_loop, daemon=True).start()
+                for _ in range(ACCEPT_THREADS):
+                    threading.Thread(target=self.accept_loop, args=(server_socket,), daemon=True).start()
+                self.accept_stop.wait()
         except Exception as e:
             logging.error(f"Erreur serveur: {e}\n{traceback.format_exc()}")
         finally:
             try:
-                server_socket.close()
+                self.close_server_socket(server_socket)
             except:
                 pass
+            self.flush_stop.set()
+            self.flush_variable_data()
             self.mongo_client.close()
             logging.info("Serveur arrêté")
 